@@ -35,7 +35,7 @@ class AISystem:
 
             response = await self._call_openrouter(message, context)
             if response and response.strip():
-                logger.info(f"✅ OpenRouter ответ получен: {response[:100]}...")
+                logger.info("✅ OpenRouter ответ получен: %s...", response[:100])
                 return response
 
             logger.error("❌ OpenRouter не дал ответ")
@@ -48,7 +48,7 @@ class AISystem:
     async def _call_openrouter(self, message: str, context: str) -> Optional[str]:
         """Вызов OpenRouter API"""
         try:
-            logger.info(f"🔄 Пробуем OpenRouter API: {message[:50]}...")
+            logger.info("🔄 Пробуем OpenRouter API: %s...", message[:50])
             
             # Список бесплатных моделей OpenRouter
             models = [
@@ -64,7 +64,7 @@ class AISystem:
             async with httpx.AsyncClient(timeout=30.0) as client:
                 for model in models:
                     try:
-                        logger.info(f"🔄 Пробуем модель: {model}")
+                        logger.info("🔄 Пробуем модель: %s", model)
                         
                         response = await client.post(
                             "https://openrouter.ai/api/v1/chat/completions",
@@ -87,13 +87,13 @@ class AISystem:
                         
                         if response.status_code == 200:
                             data = response.json()
-                            logger.debug(f"OpenRouter {model} raw response: {data}")
+                            logger.debug("OpenRouter %s raw response: %s", model, data)
                             if 'choices' in data and len(data['choices']) > 0:
                                 ai_response = data['choices'][0]['message']['content']
                                 if ai_response and ai_response.strip():
                                     # Очищаем токены модели от OpenRouter
                                     ai_response = self._clean_ai_response(ai_response)
-                                    logger.info(f"✅ OpenRouter ответ получен от {model}: {ai_response[:100]}...")
+                                    logger.info("✅ OpenRouter ответ получен от %s: %s...", model, ai_response[:100])
                                     return ai_response
                                 else:
                                     logger.warning(f"⚠️ {model} вернул пустой ответ")
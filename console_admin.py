@@ -1,8 +1,6 @@
 """
 Консольная панель администратора для VK Бота
 """
-import os
-import threading
 import logging
 from datetime import datetime
 from typing import Dict, Any
@@ -39,15 +37,18 @@ class ConsoleAdmin:
     def print_status(self):
         """Вывести статус в консоль"""
         stats = self.get_stats()
-        print("\n" + "="*50)
-        print("🤖 СТАТУС VK БОТА")
-        print("="*50)
-        print(f"⏱️  Время работы: {stats['uptime']}")
-        print(f"📨 Сообщений обработано: {stats['messages_processed']}")
-        print(f"⚡ Команд выполнено: {stats['commands_executed']}")
-        print(f"❌ Ошибок: {stats['errors_count']}")
-        print(f"🔄 Статус: {stats['status']}")
-        print("="*50)
+        # Собираем весь блок и выводим одной записью в консоль
+        print("\n".join((
+            "\n" + "="*50,
+            "🤖 СТАТУС VK БОТА",
+            "="*50,
+            f"⏱️  Время работы: {stats['uptime']}",
+            f"📨 Сообщений обработано: {stats['messages_processed']}",
+            f"⚡ Команд выполнено: {stats['commands_executed']}",
+            f"❌ Ошибок: {stats['errors_count']}",
+            f"🔄 Статус: {stats['status']}",
+            "="*50,
+        )))
 
 # Глобальный экземпляр консольной панели
 console_admin = ConsoleAdmin()
\ No newline at end of file
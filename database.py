@@ -1,30 +1,166 @@
 """
 Система базы данных для VK Бота
 """
+import atexit
+import bisect
+import functools
 import sqlite3
-import json
 import os
+import queue
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
+# Настройки соединения: WAL + synchronous=NORMAL безопасны при сбое питания и почти
+# так же быстры, как synchronous=OFF; кэш страниц ~20 МБ, временные таблицы в памяти.
+_PRAGMAS = (
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+# Соединения долгоживущие, поэтому скомпилированные запросы держим в кэше sqlite3
+_CACHED_STATEMENTS = 256
+
+# Опыт начисляется на каждое сообщение, поэтому пишется пачкой: раз в полсекунды
+# или сразу, если накопилось много разных пользователей
+_EXP_FLUSH_INTERVAL = 0.5
+_EXP_FLUSH_MAX = 256
+
+# Один обработчик сообщения читает пользователя несколько раз подряд:
+# короткий TTL-кэш схлопывает эти чтения, записи сбрасывают запись кэша
+_USER_CACHE_TTL = 1.0
+_USER_CACHE_MAX = 4096
+
+# Таблица рангов, отсортированная по требуемому опыту. Записи общие для всех
+# вызовов get_rank_info, поэтому только для чтения
+_RANKS = (
+    MappingProxyType({"name": "🥉 Новичок", "emoji": "🥉", "exp_required": 0, "permissions": ("chat",)}),
+    MappingProxyType({"name": "🏃 Активный", "emoji": "🏃", "exp_required": 100, "permissions": ("chat", "voice")}),
+    MappingProxyType({"name": "💬 Болтун", "emoji": "💬", "exp_required": 300, "permissions": ("chat", "voice", "reactions")}),
+    MappingProxyType({"name": "🎭 Шутник", "emoji": "🎭", "exp_required": 600, "permissions": ("chat", "voice", "reactions", "jokes")}),
+    MappingProxyType({"name": "🎯 Меткий", "emoji": "🎯", "exp_required": 1000, "permissions": ("chat", "voice", "reactions", "jokes", "games")}),
+    MappingProxyType({"name": "⭐ Звезда", "emoji": "⭐", "exp_required": 1500, "permissions": ("chat", "voice", "reactions", "jokes", "games", "mentions")}),
+    MappingProxyType({"name": "🔥 Легенда", "emoji": "🔥", "exp_required": 2500, "permissions": ("chat", "voice", "reactions", "jokes", "games", "mentions", "moderate")}),
+    MappingProxyType({"name": "👑 Король", "emoji": "👑", "exp_required": 4000, "permissions": ("chat", "voice", "reactions", "jokes", "games", "mentions", "moderate", "warn")}),
+    MappingProxyType({"name": "💎 Алмаз", "emoji": "💎", "exp_required": 6000, "permissions": ("chat", "voice", "reactions", "jokes", "games", "mentions", "moderate", "warn", "mute")}),
+    MappingProxyType({"name": "🚀 Космос", "emoji": "🚀", "exp_required": 10000, "permissions": ("chat", "voice", "reactions", "jokes", "games", "mentions", "moderate", "warn", "mute", "kick", "ban")}),
+)
+_RANKS_BY_LEVEL = dict(enumerate(_RANKS, 1))
+_RANK_THRESHOLDS = tuple(rank["exp_required"] for rank in _RANKS)
+# Права каждого уровня собраны заранее, проверка права — одна операция над множеством
+_RANK_PERMISSIONS = tuple(frozenset(rank["permissions"]) for rank in _RANKS)
+
+
+def _rank_level(exp: int) -> int:
+    """Уровень ранга для заданного опыта"""
+    return max(1, bisect.bisect_right(_RANK_THRESHOLDS, exp))
+
+
 class DatabaseManager:
     """Менеджер базы данных SQLite"""
     
     def __init__(self, db_path: str = "vk_bot.db"):
         self.db_path = db_path
+        # WAL позволяет читать параллельно с записью: один писатель под блокировкой
+        # и пул соединений только для чтения
+        self._writer: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=os.cpu_count() or 1)
+        self._read_uri = f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+        self._exp_pending: Dict[int, int] = {}
+        self._exp_lock = threading.Lock()
+        # Опыт, который сейчас записывает flush_experience, и счётчик поколений:
+        # нечётное значение означает, что идёт COMMIT записи опыта
+        self._exp_inflight: Dict[int, int] = {}
+        self._exp_generation = 0
+        self._exp_changed = threading.Condition(self._exp_lock)
+        self._flush_lock = threading.Lock()
+        self._exp_timer: Optional[threading.Timer] = None
+        self._user_cache: Dict[int, Tuple[float, Dict]] = {}
+        # Список админов меняется только через set_admin, который и сбрасывает кэш
+        self._is_admin_cached = functools.lru_cache(maxsize=4096)(self._query_is_admin)
         self.init_database()
+        atexit.register(self.flush_experience)
+    
+    def _connect(self, database: Optional[str] = None, **kwargs) -> sqlite3.Connection:
+        """Открыть соединение с применёнными PRAGMA"""
+        conn = sqlite3.connect(database or self.db_path, check_same_thread=False,
+                               cached_statements=_CACHED_STATEMENTS, **kwargs)
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """Взять соединение для чтения из пула"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._connect(self._read_uri, uri=True, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA query_only=1")
+        try:
+            yield conn
+        finally:
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Connection]:
+        """Транзакция на единственном соединении для записи.
+
+        BEGIN IMMEDIATE берёт блокировку записи сразу, а не при первом UPDATE,
+        поэтому отложенная транзакция не упирается в SQLITE_BUSY при повышении.
+        """
+        with self._write_lock:
+            conn = self._writer
+            if conn is None:
+                raise sqlite3.OperationalError("Соединение для записи не открыто")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    
+    def close(self):
+        """Закрыть все соединения с базой данных"""
+        self.flush_experience()
+        atexit.unregister(self.flush_experience)
+        # Соединение для записи закрывается последним: только оно может
+        # выполнить итоговый checkpoint и удалить -wal/-shm
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
     
     def init_database(self):
         """Инициализация базы данных"""
         try:
-            # На Windows файлы БД могут оставаться заблокированными в тестах.
-            # Включаем WAL и уменьшенные таймауты, чтобы быстрее освобождались дескрипторы.
-            with sqlite3.connect(self.db_path, timeout=0.5, isolation_level=None) as conn:
-                conn.execute('PRAGMA journal_mode=WAL;')
-                conn.execute('PRAGMA synchronous=OFF;')
+            # journal_mode=WAL сохраняется в файле БД, остальные PRAGMA — на соединение
+            self._writer = self._connect(isolation_level=None)
+            self._writer.row_factory = sqlite3.Row
+            self._writer.execute('PRAGMA journal_mode=WAL;')
+            with self._tx() as conn:
                 conn.execute('''
                     CREATE TABLE IF NOT EXISTS users (
                         user_id INTEGER PRIMARY KEY,
@@ -38,12 +174,17 @@ class DatabaseManager:
                         reactions_count INTEGER DEFAULT 0,
                         warnings INTEGER DEFAULT 0,
                         banned INTEGER DEFAULT 0,
-                        mute_until TEXT,
+                        mute_until INTEGER,
                         join_date TEXT,
                         last_activity TEXT
                     )
                 ''')
                 
+                self._migrate_mute_until(conn)
+                
+                # Индекс для топа: ORDER BY experience DESC LIMIT n идёт по индексу
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_users_experience ON users(experience DESC)')
+                
                 conn.execute('''
                     CREATE TABLE IF NOT EXISTS chat_admins (
                         user_id INTEGER,
@@ -53,48 +194,132 @@ class DatabaseManager:
                     )
                 ''')
                 
-                logger.info("✅ База данных инициализирована")
+            logger.info("✅ База данных инициализирована")
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации БД: {e}")
     
+    def _migrate_mute_until(self, conn: sqlite3.Connection):
+        """Перевести mute_until из TEXT (строка с float) в INTEGER (unix-время в секундах)"""
+        columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(users)")}
+        if columns.get('mute_until', '').upper() != 'TEXT':
+            return
+        conn.execute("ALTER TABLE users ADD COLUMN mute_until_int INTEGER")
+        conn.execute("UPDATE users SET mute_until_int = CAST(CAST(mute_until AS REAL) AS INTEGER) WHERE mute_until IS NOT NULL")
+        conn.execute("ALTER TABLE users DROP COLUMN mute_until")
+        conn.execute("ALTER TABLE users RENAME COLUMN mute_until_int TO mute_until")
+        logger.info("✅ Столбец mute_until переведён в INTEGER")
+    
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Получить пользователя по ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-                result = cursor.fetchone()
-                return dict(result) if result else None
+            with self._exp_lock:
+                cached = self._user_cache.get(user_id)
+                if cached and not self._exp_generation % 2 and time.monotonic() - cached[0] < _USER_CACHE_TTL:
+                    user = dict(cached[1])
+                    # Учитываем ещё не записанный опыт
+                    user['experience'] += self._unflushed_exp(user_id)
+                    return user
+            
+            def read():
+                with self._reader() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+                    return cursor.fetchone()
+            
+            result, pending = self._read_with_pending(user_id, read, cache=True)
+            if not result:
+                return None
+            user = dict(result)
+            user['experience'] += pending
+            return user
         except Exception as e:
             logger.error(f"Ошибка получения пользователя {user_id}: {e}")
             return None
     
+    def _unflushed_exp(self, user_id: int) -> int:
+        """Опыт, ещё не видимый в БД (вызывать под _exp_lock)"""
+        return self._exp_pending.get(user_id, 0) + self._exp_inflight.get(user_id, 0)
+    
+    def _read_with_pending(self, user_id: int, read, cache: bool = False):
+        """Прочитать строку без блокировки и вернуть (строка, незаписанный опыт).
+
+        SELECT идёт вне _exp_lock, а добавка берётся под ним. Если за это время
+        flush_experience закоммитил опыт (сменилось поколение), чтение повторяется,
+        иначе опыт учёлся бы дважды. Строка кладётся в кэш в той же критической
+        секции, поэтому устаревшая строка не возвращается в кэш после flush.
+        """
+        while True:
+            with self._exp_changed:
+                self._exp_changed.wait_for(lambda: not self._exp_generation % 2)
+                generation = self._exp_generation
+            row = read()
+            with self._exp_lock:
+                if self._exp_generation == generation:
+                    if cache and row:
+                        self._cache_user(user_id, dict(row))
+                    return row, self._unflushed_exp(user_id)
+    
+    def _cache_user(self, user_id: int, user: Dict):
+        """Положить строку пользователя в TTL-кэш"""
+        if len(self._user_cache) >= _USER_CACHE_MAX:
+            self._user_cache.clear()
+        self._user_cache[user_id] = (time.monotonic(), user)
+    
+    def _get_col(self, user_id: int, column: str):
+        """Прочитать одно поле пользователя (None если пользователя нет)"""
+        with self._reader() as conn:
+            row = conn.execute(f"SELECT {column} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            return row[0] if row else None
+    
+    def _get_experience(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """Получить (опыт, уровень ранга) пользователя с учётом незаписанного опыта"""
+        def read():
+            with self._reader() as conn:
+                return conn.execute("SELECT experience, rank_level FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        
+        row, pending = self._read_with_pending(user_id, read)
+        if not row:
+            return None
+        return row[0] + pending, row[1]
+    
     def create_or_update_user(self, user_id: int, user_info: Dict) -> Dict:
         """Создать или обновить пользователя"""
         try:
             current_time = datetime.now().isoformat()
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('''
-                    INSERT OR REPLACE INTO users 
-                    (user_id, first_name, last_name, join_date, last_activity)
-                    VALUES (?, ?, ?, COALESCE((SELECT join_date FROM users WHERE user_id = ?), ?), ?)
-                ''', (user_id, user_info.get('first_name', ''), user_info.get('last_name', ''), 
-                      user_id, current_time, current_time))
-                
-            return self.get_user(user_id)
+            def upsert():
+                with self._tx() as conn:
+                    # UPSERT обновляет строку на месте и не сбрасывает опыт, варны и баны
+                    return conn.execute('''
+                        INSERT INTO users (user_id, first_name, last_name, join_date, last_activity)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            first_name = excluded.first_name,
+                            last_name = excluded.last_name,
+                            last_activity = excluded.last_activity
+                        RETURNING *
+                    ''', (user_id, user_info.get('first_name', ''), user_info.get('last_name', ''),
+                          current_time, current_time)).fetchone()
+            
+            row, pending = self._read_with_pending(user_id, upsert, cache=True)
+            user = dict(row)
+            user['experience'] += pending
+            return user
         except Exception as e:
             logger.error(f"Ошибка создания пользователя {user_id}: {e}")
             return None
     
+    def _query_is_admin(self, user_id: int, chat_id: int) -> bool:
+        """Запрос админа в БД (без кэша)"""
+        with self._reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM chat_admins WHERE user_id = ? AND chat_id = ?", (user_id, chat_id))
+            return cursor.fetchone() is not None
+    
     def is_admin(self, user_id: int, chat_id: int) -> bool:
         """Проверить админа"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1 FROM chat_admins WHERE user_id = ? AND chat_id = ?", (user_id, chat_id))
-                return cursor.fetchone() is not None
+            return self._is_admin_cached(user_id, chat_id)
         except Exception as e:
             logger.error(f"Ошибка проверки админа: {e}")
             return False
@@ -102,43 +327,71 @@ class DatabaseManager:
     def set_admin(self, user_id: int, chat_id: int, is_owner: bool = False):
         """Установить админа"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._tx() as conn:
                 conn.execute("INSERT OR REPLACE INTO chat_admins VALUES (?, ?, ?)", 
                            (user_id, chat_id, 1 if is_owner else 0))
+            self._is_admin_cached.cache_clear()
         except Exception as e:
             logger.error(f"Ошибка установки админа: {e}")
     
-    def get_rank_info(self, rank_level: int) -> Dict:
-        """Получить информацию о ранге"""
-        ranks = {
-            1: {"name": "🥉 Новичок", "emoji": "🥉", "exp_required": 0, "permissions": ["chat"]},
-            2: {"name": "🏃 Активный", "emoji": "🏃", "exp_required": 100, "permissions": ["chat", "voice"]},
-            3: {"name": "💬 Болтун", "emoji": "💬", "exp_required": 300, "permissions": ["chat", "voice", "reactions"]},
-            4: {"name": "🎭 Шутник", "emoji": "🎭", "exp_required": 600, "permissions": ["chat", "voice", "reactions", "jokes"]},
-            5: {"name": "🎯 Меткий", "emoji": "🎯", "exp_required": 1000, "permissions": ["chat", "voice", "reactions", "jokes", "games"]},
-            6: {"name": "⭐ Звезда", "emoji": "⭐", "exp_required": 1500, "permissions": ["chat", "voice", "reactions", "jokes", "games", "mentions"]},
-            7: {"name": "🔥 Легенда", "emoji": "🔥", "exp_required": 2500, "permissions": ["chat", "voice", "reactions", "jokes", "games", "mentions", "moderate"]},
-            8: {"name": "👑 Король", "emoji": "👑", "exp_required": 4000, "permissions": ["chat", "voice", "reactions", "jokes", "games", "mentions", "moderate", "warn"]},
-            9: {"name": "💎 Алмаз", "emoji": "💎", "exp_required": 6000, "permissions": ["chat", "voice", "reactions", "jokes", "games", "mentions", "moderate", "warn", "mute"]},
-            10: {"name": "🚀 Космос", "emoji": "🚀", "exp_required": 10000, "permissions": ["chat", "voice", "reactions", "jokes", "games", "mentions", "moderate", "warn", "mute", "kick", "ban"]}
-        }
-        return ranks.get(rank_level, {"name": "🥉 Новичок", "emoji": "🥉", "exp_required": 0, "permissions": ["chat"]})
+    def get_rank_info(self, rank_level: int) -> Mapping:
+        """Получить информацию о ранге (только для чтения)"""
+        return _RANKS_BY_LEVEL.get(rank_level, _RANKS[0])
     
     def add_experience(self, user_id: int, exp: int):
-        """Добавить опыт пользователю"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("UPDATE users SET experience = experience + ? WHERE user_id = ?", (exp, user_id))
-        except Exception as e:
-            logger.error(f"Ошибка добавления опыта: {e}")
+        """Добавить опыт пользователю (запись откладывается до flush_experience)"""
+        with self._exp_lock:
+            self._exp_pending[user_id] = self._exp_pending.get(user_id, 0) + exp
+            flush_now = len(self._exp_pending) >= _EXP_FLUSH_MAX
+            if not flush_now and self._exp_timer is None:
+                self._exp_timer = threading.Timer(_EXP_FLUSH_INTERVAL, self.flush_experience)
+                self._exp_timer.daemon = True
+                self._exp_timer.start()
+        if flush_now:
+            self.flush_experience()
+    
+    def flush_experience(self):
+        """Записать накопленный опыт одной транзакцией"""
+        with self._flush_lock:
+            with self._exp_lock:
+                if self._exp_timer is not None:
+                    self._exp_timer.cancel()
+                    self._exp_timer = None
+                if not self._exp_pending:
+                    return
+                # Записываемый опыт остаётся видимым читателям, пока не закоммичен
+                self._exp_inflight, self._exp_pending = self._exp_pending, {}
+            try:
+                with self._tx() as conn:
+                    conn.executemany(
+                        "UPDATE users SET experience = experience + ? WHERE user_id = ?",
+                        [(exp, user_id) for user_id, exp in self._exp_inflight.items()]
+                    )
+                    # COMMIT выполняется при выходе из блока: на это время читатели
+                    # ждут, а не гадают, увидел ли их SELECT новый опыт
+                    with self._exp_lock:
+                        self._exp_generation += 1
+            except Exception as e:
+                logger.error(f"Ошибка добавления опыта: {e}")
+            finally:
+                with self._exp_changed:
+                    for user_id in self._exp_inflight:
+                        self._user_cache.pop(user_id, None)
+                    self._exp_inflight = {}
+                    # Поколение снова чётное и в любом случае сменилось
+                    self._exp_generation += 1 if self._exp_generation % 2 else 2
+                    self._exp_changed.notify_all()
     
     def get_top_users(self, limit: int = 10) -> List[Dict]:
         """Получить топ пользователей"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            self.flush_experience()
+            with self._reader() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users ORDER BY experience DESC LIMIT ?", (limit,))
+                cursor.execute(
+                    "SELECT user_id, first_name, last_name, experience, rank_level FROM users "
+                    "ORDER BY experience DESC LIMIT ?", (limit,)
+                )
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Ошибка получения топа: {e}")
@@ -147,53 +400,50 @@ class DatabaseManager:
     def get_user_rank(self, user_id: int) -> Dict:
         """Получить ранг пользователя"""
         try:
-            user = self.get_user(user_id)
-            if not user:
+            stats = self._get_experience(user_id)
+            if not stats:
                 return {"rank": "🥉 Новичок", "level": 1, "experience": 0}
             
-            exp = user.get('experience', 0)
-            level = 1
-            
-            # Определяем уровень по опыту
-            for rank_level in range(10, 0, -1):
-                rank_info = self.get_rank_info(rank_level)
-                if exp >= rank_info['exp_required']:
-                    level = rank_level
-                    break
-            
-            rank_info = self.get_rank_info(level)
+            exp = stats[0]
+            level = _rank_level(exp)
+            rank_info = _RANKS_BY_LEVEL[level]
             return {
                 "rank": rank_info['name'],
                 "level": level,
                 "experience": exp,
-                "next_level_exp": self.get_rank_info(level + 1)['exp_required'] if level < 10 else 0,
+                "next_level_exp": _RANK_THRESHOLDS[level] if level < len(_RANKS) else 0,
                 "permissions": rank_info['permissions']
             }
         except Exception as e:
             logger.error(f"Ошибка получения ранга: {e}")
             return {"rank": "🥉 Новичок", "level": 1, "experience": 0}
     
+    def get_permissions(self, user_id: int) -> FrozenSet[str]:
+        """Права пользователя по его рангу (пустое множество, если пользователя нет)"""
+        try:
+            stats = self._get_experience(user_id)
+            if not stats:
+                return frozenset()
+            return _RANK_PERMISSIONS[_rank_level(stats[0]) - 1]
+        except Exception as e:
+            logger.error(f"Ошибка получения прав: {e}")
+            return frozenset()
+    
     def update_rank(self, user_id: int):
         """Обновить ранг пользователя на основе опыта"""
         try:
-            user = self.get_user(user_id)
-            if not user:
+            stats = self._get_experience(user_id)
+            if not stats:
                 return
             
-            exp = user.get('experience', 0)
-            new_level = 1
-            
-            # Определяем новый уровень
-            for rank_level in range(10, 0, -1):
-                rank_info = self.get_rank_info(rank_level)
-                if exp >= rank_info['exp_required']:
-                    new_level = rank_level
-                    break
+            exp, rank_level = stats
+            new_level = _rank_level(exp)
             
             # Обновляем уровень если изменился
-            if new_level != user.get('rank_level', 1):
-                with sqlite3.connect(self.db_path) as conn:
+            if new_level != rank_level:
+                with self._tx() as conn:
                     conn.execute("UPDATE users SET rank_level = ? WHERE user_id = ?", (new_level, user_id))
+                self._user_cache.pop(user_id, None)
                 logger.info(f"Пользователь {user_id} получил новый ранг: {self.get_rank_info(new_level)['name']}")
                 return True
             return False
@@ -204,9 +454,10 @@ class DatabaseManager:
     def mute_user(self, user_id: int, duration_minutes: int):
         """Замутить пользователя"""
         try:
-            mute_until = datetime.now().timestamp() + (duration_minutes * 60)
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("UPDATE users SET mute_until = ? WHERE user_id = ?", (str(mute_until), user_id))
+            mute_until = int(time.time()) + duration_minutes * 60
+            with self._tx() as conn:
+                conn.execute("UPDATE users SET mute_until = ? WHERE user_id = ?", (mute_until, user_id))
+            self._user_cache.pop(user_id, None)
             logger.info(f"Пользователь {user_id} замучен на {duration_minutes} минут")
             return True
         except Exception as e:
@@ -216,8 +467,9 @@ class DatabaseManager:
     def unmute_user(self, user_id: int):
         """Размутить пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._tx() as conn:
                 conn.execute("UPDATE users SET mute_until = NULL WHERE user_id = ?", (user_id,))
+            self._user_cache.pop(user_id, None)
             logger.info(f"Пользователь {user_id} размучен")
             return True
         except Exception as e:
@@ -227,12 +479,11 @@ class DatabaseManager:
     def is_muted(self, user_id: int) -> bool:
         """Проверить замучен ли пользователь"""
         try:
-            user = self.get_user(user_id)
-            if not user or not user.get('mute_until'):
+            mute_until = self._get_col(user_id, 'mute_until')
+            if mute_until is None:
                 return False
             
-            mute_until = float(user['mute_until'])
-            if datetime.now().timestamp() > mute_until:
+            if time.time() > mute_until:
                 self.unmute_user(user_id)
                 return False
             return True
@@ -243,8 +494,9 @@ class DatabaseManager:
     def ban_user(self, user_id: int):
         """Забанить пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._tx() as conn:
                 conn.execute("UPDATE users SET banned = 1 WHERE user_id = ?", (user_id,))
+            self._user_cache.pop(user_id, None)
             logger.info(f"Пользователь {user_id} забанен")
             return True
         except Exception as e:
@@ -254,8 +506,9 @@ class DatabaseManager:
     def unban_user(self, user_id: int):
         """Разбанить пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._tx() as conn:
                 conn.execute("UPDATE users SET banned = 0 WHERE user_id = ?", (user_id,))
+            self._user_cache.pop(user_id, None)
             logger.info(f"Пользователь {user_id} разбанен")
             return True
         except Exception as e:
@@ -265,28 +518,31 @@ class DatabaseManager:
     def is_banned(self, user_id: int) -> bool:
         """Проверить забанен ли пользователь"""
         try:
-            user = self.get_user(user_id)
-            return user and user.get('banned', 0) == 1
+            return self._get_col(user_id, 'banned') == 1
         except Exception as e:
             logger.error(f"Ошибка проверки бана: {e}")
             return False
     
-    def add_warning(self, user_id: int):
-        """Добавить предупреждение"""
+    def add_warning(self, user_id: int) -> int:
+        """Добавить предупреждение и вернуть их новое количество (0 если пользователя нет)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("UPDATE users SET warnings = warnings + 1 WHERE user_id = ?", (user_id,))
+            with self._tx() as conn:
+                rows = conn.execute(
+                    "UPDATE users SET warnings = warnings + 1 WHERE user_id = ? RETURNING warnings", (user_id,)
+                ).fetchall()
+            if not rows:
+                return 0
+            self._user_cache.pop(user_id, None)
             logger.info(f"Пользователю {user_id} добавлено предупреждение")
-            return True
+            return rows[0][0]
         except Exception as e:
             logger.error(f"Ошибка добавления предупреждения: {e}")
-            return False
+            return 0
     
     def get_warnings(self, user_id: int) -> int:
         """Получить количество предупреждений"""
         try:
-            user = self.get_user(user_id)
-            return user.get('warnings', 0) if user else 0
+            return self._get_col(user_id, 'warnings') or 0
         except Exception as e:
             logger.error(f"Ошибка получения предупреждений: {e}")
             return 0
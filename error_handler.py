@@ -7,9 +7,15 @@ from __future__ import annotations
 import re
 import logging
 import asyncio
+import functools
+import random
+import time
+from collections import Counter, deque
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, TypeVar
+from itertools import islice
+from types import MappingProxyType
+from typing import Any, Callable, Coroutine, Deque, Dict, Optional, Tuple, TypeVar
 
 logger = logging.getLogger(__name__)
 
@@ -47,8 +53,20 @@ class AISystemError(Exception):
     pass
 
 
+# Временные сбои внешних систем: их имеет смысл повторить. Остальные ошибки
+# (например, ValidationError) не исчезнут при повторе и обрабатываются сразу.
+RECOVERABLE_ERRORS: Tuple[type, ...] = (
+    VKAPIError, DatabaseError, AISystemError, ConnectionError, TimeoutError,
+)
+
+
+def backoff_delay(attempt: int, *, base: float = 1.0, cap: float = 30.0, jitter: float = 0.5) -> float:
+    """Экспоненциальная задержка с джиттером: base * 2**attempt * (1 + U(0, jitter)), не больше cap."""
+    return min(cap, base * 2 ** attempt * (1 + random.uniform(0, jitter)))
+
+
 # --- Структуры данных ---
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TrackedError:
     message: str
     category: ErrorCategory
@@ -57,13 +75,25 @@ class TrackedError:
 
 T = TypeVar("T")
 
+# Сколько последних ошибок хранить в истории
+ERROR_HISTORY_LIMIT = 1000
+
+# Уровень логирования для каждой серьёзности
+_SEVERITY_LOG: Dict[ErrorSeverity, int] = {
+    ErrorSeverity.LOW: logging.WARNING,
+    ErrorSeverity.MEDIUM: logging.ERROR,
+    ErrorSeverity.HIGH: logging.ERROR,
+    ErrorSeverity.CRITICAL: logging.CRITICAL,
+}
+
 
 class ErrorHandler:
     """Централизованный обработчик ошибок с накоплением статистики."""
 
     def __init__(self) -> None:
-        self.error_history: List[TrackedError] = []
-        self.error_counts: Dict[str, int] = {}
+        self.error_history: Deque[TrackedError] = deque(maxlen=ERROR_HISTORY_LIMIT)
+        self.error_counts: Counter[str] = Counter()
+        self.total_errors = 0
 
     def _key(self, category: ErrorCategory, exc: BaseException) -> str:
         return f"{category.value}_{exc.__class__.__name__}"
@@ -80,32 +110,33 @@ class ErrorHandler:
         Возвращает True если можно продолжать работу, False — если критическая ошибка.
         """
         key = self._key(category, exc)
-        self.error_counts[key] = self.error_counts.get(key, 0) + 1
+        self.error_counts[key] += 1
+        self.total_errors += 1
+        message = str(exc)
         self.error_history.append(
-            TrackedError(message=str(exc), category=category, severity=severity)
+            TrackedError(message=message, category=category, severity=severity)
         )
 
-        extra = f" context={context}" if context else ""
-        log_msg = f"[{category.value}/{severity.value}] {exc}{extra}"
-
-        if severity == ErrorSeverity.LOW:
-            logger.warning(log_msg)
-            return True
-        if severity == ErrorSeverity.MEDIUM:
-            logger.error(log_msg)
-            return True
-        if severity == ErrorSeverity.HIGH:
-            logger.error(log_msg)
-            return True
-        # CRITICAL
-        logger.critical(log_msg)
-        return False
+        # Строка собирается самим logging и только если запись будет выведена
+        level = _SEVERITY_LOG[severity]
+        if context:
+            logger.log(level, "[%s/%s] %s context=%s", category.value, severity.value,
+                       message, context)
+        else:
+            logger.log(level, "[%s/%s] %s", category.value, severity.value, message)
+        return severity is not ErrorSeverity.CRITICAL
 
     def get_error_statistics(self) -> Dict[str, Any]:
+        """
+        error_counts — живое представление только для чтения без копирования
+        (для сериализации в JSON нужен dict(...)), recent_errors — последние 10 от старых к новым.
+        """
+        recent = [e.message for e in islice(reversed(self.error_history), 10)]
+        recent.reverse()
         return {
-            "total_errors": len(self.error_history),
-            "error_counts": dict(self.error_counts),
-            "recent_errors": [e.message for e in self.error_history[-10:]],
+            "total_errors": self.total_errors,
+            "error_counts": MappingProxyType(self.error_counts),
+            "recent_errors": recent,
         }
 
 
@@ -113,6 +144,23 @@ class DataValidator:
     """Унифицированная валидация пользовательских и системных данных."""
 
     VK_TOKEN_REGEX = re.compile(r"^vk1\.a\.[A-Za-z0-9_\-\.]{20,}$")
+    # Простейшая защита от XSS/HTML-инъекций в текстовых командах.
+    # Обработчик on*= ищется только с начала слова, а посессивные квантификаторы
+    # не дают откатов: время проверки линейно даже для строк вида "ononon..."
+    DANGEROUS_CONTENT_REGEX = re.compile(r"<\s*script|\bon\w++\s*+=", re.IGNORECASE)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _vk_token_error(token: str) -> Optional[str]:
+        """Текст ошибки для токена или None. Токен перепроверяется при каждом
+        переподключении, поэтому результат кэшируется; исключения не кэшируются."""
+        # Сначала короткий токен, если выглядит как vk1.a.* (для ожидаемого сообщения теста)
+        if token.startswith("vk1.a.") and len(token) < 16:
+            return "Токен слишком короткий"
+        # Затем общий формат
+        if not DataValidator.VK_TOKEN_REGEX.match(token):
+            return "Неверный формат VK токена"
+        return None
 
     @staticmethod
     def validate_vk_token(token: str) -> bool:
@@ -120,12 +168,9 @@ class DataValidator:
             raise ValidationError("Токен не может быть пустым")
         if not isinstance(token, str) or not token:
             raise ValidationError("Токен не может быть пустым")
-        # Сначала короткий токен, если выглядит как vk1.a.* (для ожидаемого сообщения теста)
-        if token.startswith("vk1.a.") and len(token) < 16:
-            raise ValidationError("Токен слишком короткий")
-        # Затем общий формат
-        if not DataValidator.VK_TOKEN_REGEX.match(token):
-            raise ValidationError("Неверный формат VK токена")
+        error = DataValidator._vk_token_error(token)
+        if error:
+            raise ValidationError(error)
         return True
 
     @staticmethod
@@ -150,14 +195,19 @@ class DataValidator:
             raise ValidationError("Текст сообщения должен быть строкой")
         if len(text) > 4096:
             raise ValidationError("Сообщение слишком длинное")
-        # Простейшая защита от XSS/HTML-инъекций в текстовых командах
-        if re.search(r"<\s*script|on\w+\s*=", text, flags=re.IGNORECASE):
+        if DataValidator.DANGEROUS_CONTENT_REGEX.search(text):
             raise ValidationError("Сообщение содержит потенциально опасный контент")
         return True
 
 
 class SafeExecutor:
-    """Исполняет функции безопасно, делегируя обработку ошибок ErrorHandler."""
+    """Исполняет функции безопасно, делегируя обработку ошибок ErrorHandler.
+
+    При _retries > 0 ошибки из RECOVERABLE_ERRORS повторяются с экспоненциальной
+    задержкой (backoff_delay), в ErrorHandler попадает только последняя неудача.
+    Параметры повтора начинаются с подчёркивания, чтобы не перехватывать
+    одноимённые именованные аргументы вызываемой функции.
+    """
 
     def __init__(self, error_handler: ErrorHandler) -> None:
         self._handler = error_handler
@@ -168,13 +218,20 @@ class SafeExecutor:
         *args: Any,
         category: ErrorCategory = ErrorCategory.UNKNOWN,
         severity: ErrorSeverity = ErrorSeverity.MEDIUM,
+        _retries: int = 0,
+        _retry_base: float = 1.0,
         **kwargs: Any,
     ) -> Optional[T]:
-        try:
-            return await func(*args, **kwargs)
-        except Exception as exc:  # noqa: BLE001
-            self._handler.handle_error(exc, category=category, severity=severity)
-            return None
+        for attempt in range(_retries + 1):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as exc:  # noqa: BLE001
+                if attempt < _retries and isinstance(exc, RECOVERABLE_ERRORS):
+                    await asyncio.sleep(backoff_delay(attempt, base=_retry_base))
+                    continue
+                self._handler.handle_error(exc, category=category, severity=severity)
+                return None
+        return None
 
     def safe_execute_sync(
         self,
@@ -182,13 +239,20 @@ class SafeExecutor:
         *args: Any,
         category: ErrorCategory = ErrorCategory.UNKNOWN,
         severity: ErrorSeverity = ErrorSeverity.MEDIUM,
+        _retries: int = 0,
+        _retry_base: float = 1.0,
         **kwargs: Any,
     ) -> Optional[T]:
-        try:
-            return func(*args, **kwargs)
-        except Exception as exc:  # noqa: BLE001
-            self._handler.handle_error(exc, category=category, severity=severity)
-            return None
+        for attempt in range(_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as exc:  # noqa: BLE001
+                if attempt < _retries and isinstance(exc, RECOVERABLE_ERRORS):
+                    time.sleep(backoff_delay(attempt, base=_retry_base))
+                    continue
+                self._handler.handle_error(exc, category=category, severity=severity)
+                return None
+        return None
 
 
 # Экспортируем публичный API модуля
@@ -202,6 +266,8 @@ __all__ = [
     "VKAPIError",
     "DatabaseError",
     "AISystemError",
+    "RECOVERABLE_ERRORS",
+    "backoff_delay",
 ]
 
 
@@ -1,17 +1,33 @@
 """
 Система модерации для VK Бота
 """
+import atexit
 import logging
-from datetime import datetime
-from typing import List, Dict
+import logging.handlers
+from types import MappingProxyType
+from typing import Dict, Mapping
 
 # Настройка логирования модерации
 moderation_logger = logging.getLogger('moderation')
 moderation_handler = logging.FileHandler('moderation.log', encoding='utf-8')
 moderation_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-moderation_logger.addHandler(moderation_handler)
+# Записи копятся в памяти и сбрасываются в файл пачкой (или сразу при ERROR),
+# чтобы всплеск спама не превращался в запись на диск на каждое сообщение
+moderation_buffer = logging.handlers.MemoryHandler(
+    capacity=256, flushLevel=logging.ERROR, target=moderation_handler
+)
+moderation_logger.addHandler(moderation_buffer)
+atexit.register(moderation_buffer.flush)
 moderation_logger.setLevel(logging.INFO)
 
+# Результаты проверки неизменяемы и общие для всех вызовов
+_ALLOWED = MappingProxyType({
+    'allowed': True,
+    'reason': None,
+    'category': None,
+    'response': None
+})
+
 class ContentModeration:
     """Система модерации контента (переименовано для избежания коллизий имён)."""
     
@@ -32,53 +48,82 @@ class ContentModeration:
             'заработок', 'деньги легко', 'без вложений'
         ]
         
-        self.blocked_count = 0
-        
-    def check_content(self, message: str, user_id: int, peer_id: int) -> Dict:
-        """Проверка контента на соответствие правилам"""
-        message_lower = message.lower()
+        # Категории в порядке приоритета: (причина, название, ответ пользователю)
+        self._categories = (
+            ('inappropriate_language', 'Неподходящий язык',
+             "Извини, не могу обсуждать такие темы. Давай поговорим о чём-то другом! Например, спроси меня про науку, технологии или попроси шутку"),
+            ('hate_speech', 'Язык ненависти',
+             "Я не могу поддерживать такие высказывания. Давай общаться дружелюбно! Спроси меня что-то интересное"),
+            ('spam', 'Спам/реклама',
+             "Я не обрабатываю рекламные сообщения. Давай поговорим о чём-то интересном!"),
+        )
+        self._results = tuple(
+            MappingProxyType({
+                'allowed': False,
+                'reason': reason,
+                'category': category,
+                'response': response
+            })
+            for reason, category, response in self._categories
+        )
         
-        result = {
-            'allowed': True,
-            'reason': None,
-            'category': None,
-            'response': None
+        # Основы совпадают в любом месте слова, как и раньше: «пидорас», «заебал»,
+        # «фашисты» блокируются. Все основы лежат в одном кортеже в порядке приоритета
+        # категорий, поэтому первое найденное вхождение и есть самая важная категория.
+        # Проверка `in` на кириллице быстрее чередования в регулярном выражении
+        words_by_reason = {
+            'inappropriate_language': self.inappropriate_words,
+            'hate_speech': self.hate_speech,
+            'spam': self.spam_patterns,
         }
+        self._terms = tuple(
+            (term, priority)
+            for priority, (reason, _, _) in enumerate(self._categories)
+            for term in map(str.casefold, words_by_reason[reason])
+        )
+        # Безобидные слова, которые содержат запрещённую основу («гейзер», «реакция»):
+        # вхождение основы в такое слово не считается
+        self.allowed_words = [
+            'гейзер', 'гейм', 'реакци', 'редакци', 'фракци', 'транзакци', 'бессмерт'
+        ]
+        self._allowed_prefixes = tuple(map(str.casefold, self.allowed_words))
         
-        # Проверка на неподходящий контент
-        if any(word in message_lower for word in self.inappropriate_words):
-            result.update({
-                'allowed': False,
-                'reason': 'inappropriate_language',
-                'category': 'Неподходящий язык',
-                'response': "Извини, не могу обсуждать такие темы. Давай поговорим о чём-то другом! Например, спроси меня про науку, технологии или попроси шутку"
-            })
-            
-        # Проверка на язык ненависти
-        elif any(word in message_lower for word in self.hate_speech):
-            result.update({
-                'allowed': False,
-                'reason': 'hate_speech',
-                'category': 'Язык ненависти',
-                'response': "Я не могу поддерживать такие высказывания. Давай общаться дружелюбно! Спроси меня что-то интересное"
-            })
-            
-        # Проверка на спам
-        elif any(word in message_lower for word in self.spam_patterns):
-            result.update({
-                'allowed': False,
-                'reason': 'spam',
-                'category': 'Спам/реклама',
-                'response': "Я не обрабатываю рекламные сообщения. Давай поговорим о чём-то интересном!"
-            })
+        self.blocked_count = 0
         
-        # Логирование заблокированного контента
-        if not result['allowed']:
-            self.blocked_count += 1
-            moderation_logger.info(f"BLOCKED - Category: {result['category']}, Reason: {result['reason']}, User: {user_id}, Chat: {peer_id}")
+    def check_content(self, message: str, user_id: int, peer_id: int) -> Mapping:
+        """Проверка контента на соответствие правилам (результат только для чтения)"""
+        # Регистр приводится один раз; список исключений проверяется только
+        # после найденной основы, чистые сообщения его не касаются
+        text = message.casefold()
+        best = next(
+            (priority for term, priority in self._terms
+             if term in text and self._has_blocked_occurrence(text, term)),
+            None
+        )
+        
+        if best is None:
+            return _ALLOWED
         
+        # Логирование заблокированного контента
+        result = self._results[best]
+        self.blocked_count += 1
+        moderation_logger.info("BLOCKED - Category: %s, Reason: %s, User: %s, Chat: %s",
+                               result['category'], result['reason'], user_id, peer_id)
         return result
     
+    def _has_blocked_occurrence(self, text: str, term: str) -> bool:
+        """Есть ли вхождение основы вне слова из списка исключений"""
+        start = text.find(term)
+        while start != -1:
+            # Ищем начало слова, в котором найдено вхождение
+            word_start = start
+            while word_start and text[word_start - 1].isalpha():
+                word_start -= 1
+            if not text.startswith(self._allowed_prefixes, word_start):
+                return True
+            start = text.find(term, start + 1)
+        return False
+    
     def get_stats(self) -> Dict:
         """Статистика модерации"""
         return {
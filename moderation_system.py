@@ -2,41 +2,98 @@
 Расширенная система модерации с VK API
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+import threading
 import time
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Mapping, Tuple
 from database import db
 
 logger = logging.getLogger(__name__)
 
+# Сколько секунд действуют закэшированные права модератора
+PERMISSIONS_TTL = 30.0
+
+# Таймаут запросов к VK API (подключение, чтение), секунды
+VK_TIMEOUT = (3.05, 10)
+
+
+def _result(success: bool, message: str) -> Mapping:
+    """Неизменяемый результат действия модерации"""
+    return MappingProxyType({"success": success, "message": message})
+
+
+# Ответы с постоянным текстом создаются один раз и возвращаются всем вызывающим
+_NO_KICK_RIGHTS = _result(False, "❌ У вас нет прав для кика пользователей")
+_CANNOT_KICK_ADMIN = _result(False, "❌ Нельзя кикнуть администратора")
+_KICK_FAILED = _result(False, "❌ Произошла ошибка при кике пользователя")
+_KICKED = _result(True, "✅ Пользователь успешно исключен из беседы")
+_NO_BAN_RIGHTS = _result(False, "❌ У вас нет прав для бана пользователей")
+_CANNOT_BAN_ADMIN = _result(False, "❌ Нельзя забанить администратора")
+_BAN_DB_ERROR = _result(False, "❌ Ошибка при бане пользователя")
+_BAN_FAILED = _result(False, "❌ Произошла ошибка при бане пользователя")
+_NO_MUTE_RIGHTS = _result(False, "❌ У вас нет прав для мута пользователей")
+_CANNOT_MUTE_ADMIN = _result(False, "❌ Нельзя замутить администратора")
+_MUTE_DB_ERROR = _result(False, "❌ Ошибка при муте пользователя")
+_MUTE_FAILED = _result(False, "❌ Произошла ошибка при муте пользователя")
+_NO_WARN_RIGHTS = _result(False, "❌ У вас нет прав для выдачи предупреждений")
+_WARN_DB_ERROR = _result(False, "❌ Ошибка при выдаче предупреждения")
+_WARN_FAILED = _result(False, "❌ Произошла ошибка при выдаче предупреждения")
+_STATUS_BANNED = MappingProxyType({"status": "banned", "message": "❌ Вы забанены и не можете использовать бота"})
+_STATUS_OK = MappingProxyType({"status": "ok", "message": "✅ Статус нормальный"})
+
+
 class ModerationSystem:
     """Система модерации с VK API интеграцией"""
     
     def __init__(self, vk_token: str, group_id: int):
         self.vk_token = vk_token
         self.group_id = group_id
+        # (user_id, chat_id) -> (истекает, админ беседы, права ранга)
+        self._perm_cache: Dict[Tuple[int, int], Tuple[float, bool, FrozenSet[str]]] = {}
+        self._perm_lock = threading.Lock()
+        # Одна сессия на все запросы: TCP/TLS соединение с api.vk.com переиспользуется.
+        # Повторяются только неудачные подключения: повтор прочитанного запроса мог бы
+        # выполнить действие дважды
+        self._http = requests.Session()
+        self._http.mount('https://', HTTPAdapter(
+            pool_connections=4, pool_maxsize=16,
+            max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2)
+        ))
         
-    def kick_user(self, peer_id: int, user_id: int, admin_id: int) -> Dict:
+    def kick_user(self, peer_id: int, user_id: int, admin_id: int) -> Mapping:
         """Кикнуть пользователя из беседы"""
         try:
             # Проверяем права админа
             if not self._check_admin_permissions(admin_id, peer_id, "kick"):
-                return {"success": False, "message": "❌ У вас нет прав для кика пользователей"}
+                return _NO_KICK_RIGHTS
             
             # Проверяем что пользователь не админ
             if db.is_admin(user_id, peer_id - 2000000000):
-                return {"success": False, "message": "❌ Нельзя кикнуть администратора"}
+                return _CANNOT_KICK_ADMIN
             
+            return self._kick(peer_id, user_id, admin_id)
+                
+        except Exception as e:
+            logger.error(f"Ошибка кика пользователя: {e}")
+            return _KICK_FAILED
+    
+    def _kick(self, peer_id: int, user_id: int, admin_id: int) -> Mapping:
+        """Исключить пользователя из беседы (права уже проверены вызывающим)"""
+        try:
             # Удаляем пользователя из беседы
-            response = requests.get(
+            response = self._http.get(
                 'https://api.vk.com/method/messages.removeChatUser',
                 params={
                     'chat_id': peer_id - 2000000000,
                     'user_id': user_id,
                     'access_token': self.vk_token,
                     'v': '5.199'
-                }
+                },
+                timeout=VK_TIMEOUT
             )
             
             data = response.json()
@@ -48,30 +105,30 @@ class ModerationSystem:
                 db.add_experience(admin_id, 10)
                 
                 logger.info(f"Пользователь {user_id} кикнут из беседы {peer_id} админом {admin_id}")
-                return {"success": True, "message": f"✅ Пользователь успешно исключен из беседы"}
+                return _KICKED
             else:
                 error_msg = data.get('error', {}).get('error_msg', 'Неизвестная ошибка')
                 return {"success": False, "message": f"❌ Ошибка кика: {error_msg}"}
                 
         except Exception as e:
             logger.error(f"Ошибка кика пользователя: {e}")
-            return {"success": False, "message": "❌ Произошла ошибка при кике пользователя"}
+            return _KICK_FAILED
     
-    def ban_user(self, peer_id: int, user_id: int, admin_id: int, reason: str = "") -> Dict:
+    def ban_user(self, peer_id: int, user_id: int, admin_id: int, reason: str = "") -> Mapping:
         """Забанить пользователя"""
         try:
             # Проверяем права админа
             if not self._check_admin_permissions(admin_id, peer_id, "ban"):
-                return {"success": False, "message": "❌ У вас нет прав для бана пользователей"}
+                return _NO_BAN_RIGHTS
             
             # Проверяем что пользователь не админ
             if db.is_admin(user_id, peer_id - 2000000000):
-                return {"success": False, "message": "❌ Нельзя забанить администратора"}
+                return _CANNOT_BAN_ADMIN
             
             # Баним в базе данных
             if db.ban_user(user_id):
-                # Кикаем из беседы
-                kick_result = self.kick_user(peer_id, user_id, admin_id)
+                # Кикаем из беседы: права и цель уже проверены выше
+                kick_result = self._kick(peer_id, user_id, admin_id)
                 if kick_result["success"]:
                     # Добавляем опыт админу
                     db.add_experience(admin_id, 20)
@@ -81,22 +138,22 @@ class ModerationSystem:
                 else:
                     return {"success": True, "message": f"✅ Пользователь забанен (но не удалось исключить из беседы). Причина: {reason}"}
             else:
-                return {"success": False, "message": "❌ Ошибка при бане пользователя"}
+                return _BAN_DB_ERROR
                 
         except Exception as e:
             logger.error(f"Ошибка бана пользователя: {e}")
-            return {"success": False, "message": "❌ Произошла ошибка при бане пользователя"}
+            return _BAN_FAILED
     
-    def mute_user(self, peer_id: int, user_id: int, admin_id: int, duration_minutes: int, reason: str = "") -> Dict:
+    def mute_user(self, peer_id: int, user_id: int, admin_id: int, duration_minutes: int, reason: str = "") -> Mapping:
         """Замутить пользователя"""
         try:
             # Проверяем права админа
             if not self._check_admin_permissions(admin_id, peer_id, "mute"):
-                return {"success": False, "message": "❌ У вас нет прав для мута пользователей"}
+                return _NO_MUTE_RIGHTS
             
             # Проверяем что пользователь не админ
             if db.is_admin(user_id, peer_id - 2000000000):
-                return {"success": False, "message": "❌ Нельзя замутить администратора"}
+                return _CANNOT_MUTE_ADMIN
             
             # Мутим пользователя
             if db.mute_user(user_id, duration_minutes):
@@ -106,74 +163,79 @@ class ModerationSystem:
                 logger.info(f"Пользователь {user_id} замучен на {duration_minutes} минут в беседе {peer_id} админом {admin_id}. Причина: {reason}")
                 return {"success": True, "message": f"✅ Пользователь замучен на {duration_minutes} минут. Причина: {reason}"}
             else:
-                return {"success": False, "message": "❌ Ошибка при муте пользователя"}
+                return _MUTE_DB_ERROR
                 
         except Exception as e:
             logger.error(f"Ошибка мута пользователя: {e}")
-            return {"success": False, "message": "❌ Произошла ошибка при муте пользователя"}
+            return _MUTE_FAILED
     
-    def warn_user(self, peer_id: int, user_id: int, admin_id: int, reason: str = "") -> Dict:
+    def warn_user(self, peer_id: int, user_id: int, admin_id: int, reason: str = "") -> Mapping:
         """Выдать предупреждение пользователю"""
         try:
             # Проверяем права админа
             if not self._check_admin_permissions(admin_id, peer_id, "warn"):
-                return {"success": False, "message": "❌ У вас нет прав для выдачи предупреждений"}
+                return _NO_WARN_RIGHTS
             
-            # Добавляем предупреждение
-            if db.add_warning(user_id):
-                warnings = db.get_warnings(user_id)
-                
+            # Добавляем предупреждение (возвращается новое количество)
+            warnings = db.add_warning(user_id)
+            if warnings:
                 # Добавляем опыт админу
                 db.add_experience(admin_id, 3)
                 
-                # Автоматические действия при накоплении предупреждений
-                if warnings >= 3:
+                # Автоматические действия при накоплении предупреждений:
+                # количество уже известно из add_warning, проверяем от строгого к мягкому
+                if warnings >= 5:
+                    # Автобан
+                    ban_result = self.ban_user(peer_id, user_id, admin_id, f"Автобан за {warnings} предупреждений")
+                    if ban_result["success"]:
+                        return {"success": True, "message": f"⚠️ Предупреждение выдано ({warnings}/5). АВТОБАН! Причина: {reason}"}
+
+                    # Забанить не удалось (нет права ban или цель — админ беседы):
+                    # остаёмся на автомуте
+                    db.mute_user(user_id, 30)
+                    logger.info(f"Автобан пользователя {user_id} не выполнен, выдан автомут: {ban_result['message']}")
+                    return {"success": True, "message": f"⚠️ Предупреждение выдано ({warnings}/5). Автомут на 30 минут! {ban_result['message']} Причина: {reason}"}
+                elif warnings >= 3:
                     # Автомут на 30 минут
                     db.mute_user(user_id, 30)
                     logger.info(f"Пользователь {user_id} получил автомута за 3 предупреждения")
                     return {"success": True, "message": f"⚠️ Предупреждение выдано ({warnings}/3). Автомут на 30 минут! Причина: {reason}"}
-                elif warnings >= 5:
-                    # Автобан
-                    ban_result = self.ban_user(peer_id, user_id, admin_id, f"Автобан за {warnings} предупреждений")
-                    return {"success": True, "message": f"⚠️ Предупреждение выдано ({warnings}/5). АВТОБАН! Причина: {reason}"}
                 else:
                     logger.info(f"Пользователю {user_id} выдано предупреждение в беседе {peer_id} админом {admin_id}. Причина: {reason}")
                     return {"success": True, "message": f"⚠️ Предупреждение выдано ({warnings}/5). Причина: {reason}"}
             else:
-                return {"success": False, "message": "❌ Ошибка при выдаче предупреждения"}
+                return _WARN_DB_ERROR
                 
         except Exception as e:
             logger.error(f"Ошибка выдачи предупреждения: {e}")
-            return {"success": False, "message": "❌ Произошла ошибка при выдаче предупреждения"}
+            return _WARN_FAILED
     
     def _check_admin_permissions(self, user_id: int, peer_id: int, action: str) -> bool:
         """Проверить права администратора"""
         try:
-            # Проверяем в базе данных
-            if db.is_admin(user_id, peer_id - 2000000000):
-                return True
-            
-            # Проверяем ранг пользователя
-            user_rank = db.get_user_rank(user_id)
-            permissions = user_rank.get('permissions', [])
-            
-            # Проверяем права на действие
-            if action == "kick" and "kick" in permissions:
-                return True
-            elif action == "ban" and "ban" in permissions:
-                return True
-            elif action == "mute" and "mute" in permissions:
-                return True
-            elif action == "warn" and "warn" in permissions:
-                return True
-            elif action == "moderate" and "moderate" in permissions:
-                return True
-            
-            return False
+            is_admin, permissions = self._get_permissions(user_id, peer_id - 2000000000)
+            # Название действия совпадает с названием права ранга
+            return is_admin or action in permissions
         except Exception as e:
             logger.error(f"Ошибка проверки прав: {e}")
             return False
     
+    def _get_permissions(self, user_id: int, chat_id: int) -> Tuple[bool, FrozenSet[str]]:
+        """Права пользователя в беседе, кэшируются на PERMISSIONS_TTL секунд"""
+        key = (user_id, chat_id)
+        now = time.monotonic()
+        with self._perm_lock:
+            cached = self._perm_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1], cached[2]
+        
+        # Ранг нужен только если пользователь не админ беседы
+        is_admin = db.is_admin(user_id, chat_id)
+        permissions = frozenset() if is_admin else db.get_permissions(user_id)
+        with self._perm_lock:
+            self._perm_cache[key] = (now + PERMISSIONS_TTL, is_admin, permissions)
+        return is_admin, permissions
+    
     def _clear_user_messages(self, peer_id: int, user_id: int):
         """Очистить сообщения пользователя (заглушка)"""
         try:
@@ -183,18 +245,18 @@ class ModerationSystem:
         except Exception as e:
             logger.error(f"Ошибка очистки сообщений: {e}")
     
-    def check_user_status(self, user_id: int) -> Dict:
+    def check_user_status(self, user_id: int) -> Mapping:
         """Проверить статус пользователя"""
         try:
             if db.is_banned(user_id):
-                return {"status": "banned", "message": "❌ Вы забанены и не можете использовать бота"}
+                return _STATUS_BANNED
             elif db.is_muted(user_id):
                 user = db.get_user(user_id)
                 mute_until = float(user['mute_until'])
                 mute_time = datetime.fromtimestamp(mute_until)
                 return {"status": "muted", "message": f"🔇 Вы замучены до {mute_time.strftime('%H:%M:%S')}"}
             else:
-                return {"status": "ok", "message": "✅ Статус нормальный"}
+                return _STATUS_OK
         except Exception as e:
             logger.error(f"Ошибка проверки статуса: {e}")
-            return {"status": "ok", "message": "✅ Статус нормальный"}
+            return _STATUS_OK
@@ -5,6 +5,8 @@ import pytest
 import sqlite3
 import tempfile
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 from database import DatabaseManager
@@ -21,6 +23,8 @@ class TestDatabaseManager:
     
     def teardown_method(self):
         """Очистка после каждого теста"""
+        # Закрываем соединения, иначе остаются -wal/-shm и файл занят (Windows)
+        self.db_manager.close()
         # Удаляем временную базу данных
         if os.path.exists(self.temp_db.name):
             try:
@@ -47,6 +51,7 @@ class TestDatabaseManager:
             # Проверяем таблицу chat_admins
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='chat_admins'")
             assert cursor.fetchone() is not None
+        conn.close()
     
     def test_create_or_update_user(self):
         """Тест создания и обновления пользователя"""
@@ -111,7 +116,22 @@ class TestDatabaseManager:
         assert result is not None
         assert result['first_name'] == 'Обновленный'
         assert result['last_name'] == 'Пользователь'
-    
+
+    def test_update_user_keeps_progress(self):
+        """Тест что повторная регистрация не сбрасывает опыт и предупреждения"""
+        user_id = 123456789
+        user_info = {'first_name': 'Тест', 'last_name': 'Пользователь'}
+        created = self.db_manager.create_or_update_user(user_id, user_info)
+
+        self.db_manager.add_experience(user_id, 150)
+        self.db_manager.flush_experience()
+        self.db_manager.add_warning(user_id)
+
+        result = self.db_manager.create_or_update_user(user_id, user_info)
+        assert result['experience'] == 150
+        assert result['warnings'] == 1
+        assert result['join_date'] == created['join_date']
+
     def test_set_admin(self):
         """Тест установки администратора"""
         user_id = 123456789
@@ -140,7 +160,16 @@ class TestDatabaseManager:
         """Тест проверки несуществующего админа"""
         is_admin = self.db_manager.is_admin(999999999, 2000000001)
         assert is_admin is False
-    
+
+    def test_is_admin_cache_invalidated(self):
+        """Тест сброса кэша админов после set_admin"""
+        user_id = 123456789
+        chat_id = 2000000001
+
+        assert self.db_manager.is_admin(user_id, chat_id) is False
+        self.db_manager.set_admin(user_id, chat_id)
+        assert self.db_manager.is_admin(user_id, chat_id) is True
+
     def test_get_rank_info(self):
         """Тест получения информации о рангах"""
         # Тестируем все ранги
@@ -157,6 +186,13 @@ class TestDatabaseManager:
         rank_info = self.db_manager.get_rank_info(999)
         assert rank_info is not None
         assert rank_info['name'] == "🥉 Новичок"  # Должен вернуть ранг по умолчанию
+
+    def test_get_rank_info_read_only(self):
+        """Тест что общую таблицу рангов нельзя испортить через результат"""
+        rank_info = self.db_manager.get_rank_info(1)
+        with pytest.raises(TypeError):
+            rank_info['name'] = "Сломано"
+        assert self.db_manager.get_rank_info(1)['name'] == "🥉 Новичок"
     
     def test_get_top_users_empty(self):
         """Тест получения топа пользователей из пустой базы"""
@@ -180,6 +216,7 @@ class TestDatabaseManager:
             conn.execute("UPDATE users SET experience = ? WHERE user_id = ?", (100, 111))
             conn.execute("UPDATE users SET experience = ? WHERE user_id = ?", (200, 222))
             conn.execute("UPDATE users SET experience = ? WHERE user_id = ?", (300, 333))
+        conn.close()
         
         # Получаем топ пользователей
         top_users = self.db_manager.get_top_users(limit=2)
@@ -196,6 +233,7 @@ class TestDatabaseManager:
         # Попытка получить пользователя должна вернуть None
         user = invalid_db.get_user(123)
         assert user is None
+        invalid_db.close()
     
     def test_sql_injection_protection(self):
         """Тест защиты от SQL инъекций"""
@@ -213,6 +251,7 @@ class TestDatabaseManager:
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
             assert cursor.fetchone() is not None
+        conn.close()
         
         # Проверяем что пользователь создался с экранированным именем
         assert result is not None
@@ -250,6 +289,192 @@ class TestDatabaseManager:
             assert result is not None
             assert result['user_id'] in range(100, 105)
 
+    def test_read_during_open_write(self):
+        """Тест чтения во время незавершённой записи (WAL)"""
+        user_id = 123456789
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+
+        with self.db_manager._tx() as conn:
+            conn.execute("UPDATE users SET experience = 500 WHERE user_id = ?", (user_id,))
+            # Читатель не блокируется и видит последнее зафиксированное состояние
+            assert self.db_manager._get_col(user_id, 'experience') == 0
+
+        assert self.db_manager._get_col(user_id, 'experience') == 500
+
+    def test_add_experience_batched(self):
+        """Тест отложенной записи опыта"""
+        user_id = 123456789
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+
+        for _ in range(5):
+            self.db_manager.add_experience(user_id, 2)
+
+        # Накопленный опыт виден сразу, до записи в БД
+        assert self.db_manager.get_user(user_id)['experience'] == 10
+
+        self.db_manager.flush_experience()
+        with sqlite3.connect(self.temp_db.name) as conn:
+            stored = conn.execute("SELECT experience FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+        conn.close()
+        assert stored == 10
+        assert self.db_manager.get_user(user_id)['experience'] == 10
+
+    def test_read_during_experience_flush(self, monkeypatch):
+        """Тест что чтение во время flush_experience не учитывает опыт дважды"""
+        user_id = 123456789
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+        self.db_manager.add_experience(user_id, 10)
+        seen = []
+        readers = []
+        tx = self.db_manager._tx
+
+        @contextmanager
+        def tx_then_read():
+            with tx() as conn:
+                yield conn
+            # Опыт уже закоммичен, а незаписанный ещё не очищен: читаем из другого потока
+            reader = threading.Thread(target=lambda: seen.append(self.db_manager.get_user(user_id)['experience']))
+            reader.start()
+            reader.join(timeout=0.2)
+            readers.append(reader)
+
+        monkeypatch.setattr(self.db_manager, "_tx", tx_then_read)
+        # Читатель должен дойти до БД, а не взять строку из кэша
+        self.db_manager._user_cache.clear()
+        self.db_manager.flush_experience()
+        monkeypatch.undo()
+        readers[0].join()
+
+        assert seen == [10]
+        assert self.db_manager.get_user(user_id)['experience'] == 10
+
+    def test_read_not_blocked_by_flush_write(self, monkeypatch):
+        """Тест что чтение не ждёт незавершённую транзакцию flush_experience"""
+        user_id = 123456789
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+        self.db_manager.add_experience(user_id, 10)
+        seen = []
+        readers = []
+        tx = self.db_manager._tx
+
+        @contextmanager
+        def read_inside_tx():
+            with tx() as conn:
+                # Транзакция записи открыта, опыт ещё не закоммичен
+                reader = threading.Thread(target=lambda: seen.append(self.db_manager.get_user(user_id)['experience']))
+                reader.start()
+                reader.join(timeout=1.0)
+                readers.append(reader.is_alive())
+                yield conn
+
+        monkeypatch.setattr(self.db_manager, "_tx", read_inside_tx)
+        self.db_manager._user_cache.clear()
+        self.db_manager.flush_experience()
+
+        assert readers == [False]
+        assert seen == [10]
+
+    def test_get_user_cache_invalidated_on_write(self):
+        """Тест сброса кэша пользователя после записи"""
+        user_id = 123456789
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+        assert self.db_manager.get_user(user_id)['banned'] == 0
+
+        self.db_manager.ban_user(user_id)
+        assert self.db_manager.get_user(user_id)['banned'] == 1
+
+        # Изменение возвращённого словаря не портит кэш
+        self.db_manager.get_user(user_id)['banned'] = 0
+        assert self.db_manager.get_user(user_id)['banned'] == 1
+
+    def test_moderation_state(self):
+        """Тест проверок бана, мута и предупреждений"""
+        user_id = 123456789
+        assert self.db_manager.is_banned(user_id) is False
+        assert self.db_manager.is_muted(user_id) is False
+        assert self.db_manager.get_warnings(user_id) == 0
+        assert self.db_manager.add_warning(user_id) == 0
+
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+        self.db_manager.ban_user(user_id)
+        self.db_manager.mute_user(user_id, 10)
+        assert self.db_manager.add_warning(user_id) == 1
+        assert self.db_manager.add_warning(user_id) == 2
+
+        assert self.db_manager.is_banned(user_id) is True
+        assert self.db_manager.is_muted(user_id) is True
+        assert self.db_manager.get_warnings(user_id) == 2
+
+        self.db_manager.unban_user(user_id)
+        self.db_manager.unmute_user(user_id)
+        assert self.db_manager.is_banned(user_id) is False
+        assert self.db_manager.is_muted(user_id) is False
+
+    def test_mute_until_integer(self):
+        """Тест хранения mute_until как INTEGER и снятия истёкшего мута"""
+        user_id = 123456789
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+        self.db_manager.mute_user(user_id, 10)
+
+        mute_until = self.db_manager.get_user(user_id)['mute_until']
+        assert isinstance(mute_until, int)
+
+        with sqlite3.connect(self.temp_db.name) as conn:
+            conn.execute("UPDATE users SET mute_until = ? WHERE user_id = ?", (mute_until - 3600, user_id))
+        conn.close()
+        assert self.db_manager.is_muted(user_id) is False
+        assert self.db_manager.get_user(user_id)['mute_until'] is None
+
+    def test_migrate_text_mute_until(self):
+        """Тест миграции старого TEXT-столбца mute_until"""
+        self.db_manager.close()
+        os.unlink(self.temp_db.name)
+        with sqlite3.connect(self.temp_db.name) as conn:
+            conn.execute("""
+                CREATE TABLE users (
+                    user_id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT,
+                    experience INTEGER DEFAULT 0, rank_level INTEGER DEFAULT 1,
+                    messages_count INTEGER DEFAULT 0, voice_messages INTEGER DEFAULT 0,
+                    mentions_count INTEGER DEFAULT 0, reactions_count INTEGER DEFAULT 0,
+                    warnings INTEGER DEFAULT 0, banned INTEGER DEFAULT 0,
+                    mute_until TEXT, join_date TEXT, last_activity TEXT
+                )
+            """)
+            conn.execute("INSERT INTO users (user_id, mute_until) VALUES (1, ?)", (str(datetime.now().timestamp() + 600),))
+        conn.close()
+
+        self.db_manager = DatabaseManager(self.temp_db.name)
+        assert isinstance(self.db_manager.get_user(1)['mute_until'], int)
+        assert self.db_manager.is_muted(1) is True
+
+    def test_update_rank(self):
+        """Тест повышения ранга по опыту"""
+        user_id = 123456789
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+
+        assert self.db_manager.update_rank(user_id) is False
+        self.db_manager.add_experience(user_id, 350)
+        assert self.db_manager.update_rank(user_id) is True
+        assert self.db_manager.get_user(user_id)['rank_level'] == 3
+
+        rank = self.db_manager.get_user_rank(user_id)
+        assert rank['level'] == 3
+        assert rank['experience'] == 350
+        assert rank['next_level_exp'] == 600
+
+    def test_get_permissions(self):
+        """Тест прав пользователя по рангу"""
+        user_id = 123456789
+        assert self.db_manager.get_permissions(user_id) == frozenset()
+
+        self.db_manager.create_or_update_user(user_id, {'first_name': 'Тест', 'last_name': 'Пользователь'})
+        assert self.db_manager.get_permissions(user_id) == {'chat'}
+
+        self.db_manager.add_experience(user_id, 10000)
+        permissions = self.db_manager.get_permissions(user_id)
+        assert {'kick', 'ban'} <= permissions
+        assert permissions == set(self.db_manager.get_user_rank(user_id)['permissions'])
+
 class TestDatabaseIntegration:
     """Интеграционные тесты базы данных"""
     
@@ -289,8 +514,8 @@ class TestDatabaseIntegration:
             assert rank_info['name'] == "🥉 Новичок"
             
             # 5. Обновляем опыт пользователя
-            with sqlite3.connect(temp_db.name) as conn:
-                conn.execute("UPDATE users SET experience = 150, rank_level = 2 WHERE user_id = ?", (user_id,))
+            db_manager.add_experience(user_id, 150)
+            assert db_manager.update_rank(user_id) is True
             
             # 6. Проверяем обновленный ранг
             updated_user = db_manager.get_user(user_id)
@@ -302,6 +527,7 @@ class TestDatabaseIntegration:
             
         finally:
             # Очищаем временную базу
+            db_manager.close()
             if os.path.exists(temp_db.name):
                 try:
                     os.unlink(temp_db.name)
@@ -89,6 +89,26 @@ class TestErrorHandler:
         assert 'vk_api_VKAPIError' in stats['error_counts']
         assert len(stats['recent_errors']) == 2
 
+    def test_error_history_bounded(self):
+        """Тест ограничения истории ошибок"""
+        from error_handler import ERROR_HISTORY_LIMIT
+        
+        for i in range(ERROR_HISTORY_LIMIT + 5):
+            self.error_handler.handle_error(
+                ValueError(f"Error {i}"),
+                category=ErrorCategory.VALIDATION,
+                severity=ErrorSeverity.LOW
+            )
+        
+        stats = self.error_handler.get_error_statistics()
+        assert len(self.error_handler.error_history) == ERROR_HISTORY_LIMIT
+        assert stats['total_errors'] == ERROR_HISTORY_LIMIT + 5
+        assert stats['recent_errors'][0] == f"Error {ERROR_HISTORY_LIMIT - 5}"
+        assert stats['recent_errors'][-1] == f"Error {ERROR_HISTORY_LIMIT + 4}"
+        
+        with pytest.raises(TypeError):
+            stats['error_counts']['validation_ValueError'] = 0
+
 class TestDataValidator:
     """Тесты для DataValidator"""
     
@@ -142,6 +162,14 @@ class TestDataValidator:
         with pytest.raises(ValidationError, match="потенциально опасный контент"):
             DataValidator.validate_message_text(dangerous_text)
     
+    def test_validate_message_text_event_handler(self):
+        """Тест обнаружения HTML-обработчиков событий"""
+        with pytest.raises(ValidationError, match="потенциально опасный контент"):
+            DataValidator.validate_message_text("<img src=x onerror=alert(1)>")
+        # Обычный текст с "on...=" внутри слова не считается опасным
+        assert DataValidator.validate_message_text("condition = true") is True
+        assert DataValidator.validate_message_text("on" * 2048) is True
+    
     def test_validate_user_id_valid(self):
         """Тест валидации корректного user_id"""
         assert DataValidator.validate_user_id(123456789) is True
@@ -189,6 +217,63 @@ class TestSafeExecutor:
         assert result is None
         assert len(self.error_handler.error_history) == 1
     
+    def test_safe_execute_retries_recoverable(self):
+        """Тест повтора временной ошибки"""
+        calls = []
+        
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise VKAPIError("Temporary error")
+            return "ok"
+        
+        result = self.safe_executor.safe_execute_sync(
+            flaky,
+            category=ErrorCategory.VK_API,
+            _retries=2,
+            _retry_base=0
+        )
+        
+        assert result == "ok"
+        assert len(calls) == 3
+        assert len(self.error_handler.error_history) == 0
+    
+    def test_safe_execute_no_retry_for_validation(self):
+        """Тест что ошибки валидации не повторяются"""
+        calls = []
+        
+        def invalid():
+            calls.append(1)
+            raise ValidationError("Bad data")
+        
+        result = self.safe_executor.safe_execute_sync(
+            invalid,
+            category=ErrorCategory.VALIDATION,
+            _retries=3,
+            _retry_base=0
+        )
+        
+        assert result is None
+        assert len(calls) == 1
+        assert len(self.error_handler.error_history) == 1
+    
+    def test_safe_execute_passes_retries_kwarg(self):
+        """Тест что аргумент retries доходит до вызываемой функции"""
+        def fetch(retries=0):
+            return retries
+        
+        result = self.safe_executor.safe_execute_sync(fetch, retries=5)
+        
+        assert result == 5
+    
+    def test_backoff_delay(self):
+        """Тест экспоненциальной задержки с ограничением"""
+        from error_handler import backoff_delay
+        
+        assert 1.0 <= backoff_delay(0, base=1.0, jitter=0.5) <= 1.5
+        assert 4.0 <= backoff_delay(2, base=1.0, jitter=0.5) <= 6.0
+        assert backoff_delay(10, base=1.0, cap=30.0) == 30.0
+    
     @pytest.mark.asyncio
     async def test_safe_execute_async_success(self):
         """Тест успешного асинхронного выполнения"""
@@ -0,0 +1,99 @@
+"""
+Тесты для системы модерации контента
+"""
+import pytest
+
+import moderation
+from moderation import ContentModeration
+
+class TestContentModeration:
+    """Тесты для ContentModeration"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.moderation = ContentModeration()
+
+    @pytest.fixture(autouse=True)
+    def disable_moderation_log(self, monkeypatch):
+        """Не пишем BLOCKED-записи в moderation.log репозитория"""
+        monkeypatch.setattr(moderation.moderation_logger, "disabled", True)
+
+    def test_clean_message_allowed(self):
+        """Тест обычного сообщения"""
+        result = self.moderation.check_content("Привет! Как дела?", 1, 2000000001)
+
+        assert result['allowed'] is True
+        assert result['reason'] is None
+        assert self.moderation.blocked_count == 0
+
+    @pytest.mark.parametrize("message, reason", [
+        ("ты СУКА", 'inappropriate_language'),
+        ("рот ебал", 'inappropriate_language'),
+        ("я тебя убью", 'hate_speech'),
+        ("Купить недорого", 'spam'),
+        ("заработок без вложений", 'spam'),
+        ("«Скидка»!!!", 'spam'),
+        ("сдохни…", 'hate_speech'),
+    ])
+    def test_blocked_categories(self, message, reason):
+        """Тест определения категорий"""
+        result = self.moderation.check_content(message, 1, 2000000001)
+
+        assert result['allowed'] is False
+        assert result['reason'] == reason
+        assert result['response']
+        assert self.moderation.blocked_count == 1
+
+    @pytest.mark.parametrize("message, reason", [
+        ("пидорас", 'inappropriate_language'),
+        ("заебал уже", 'inappropriate_language'),
+        ("какая хуйня", 'inappropriate_language'),
+        ("сукааа", 'inappropriate_language'),
+        ("эти фашисты", 'hate_speech'),
+        ("нацисты", 'hate_speech'),
+        ("торгуем со скидками", 'spam'),
+    ])
+    def test_inflected_forms_blocked(self, message, reason):
+        """Тест что словоформы и составные слова с запрещённой основой блокируются"""
+        result = self.moderation.check_content(message, 1, 2000000001)
+
+        assert result['allowed'] is False
+        assert result['reason'] == reason
+
+    @pytest.mark.parametrize("message", [
+        "Видел гейзер на Камчатке",
+        "Новый геймпад",
+        "Какая реакция у редакции?",
+    ])
+    def test_allowed_words(self, message):
+        """Тест что слова из списка исключений не блокируются"""
+        result = self.moderation.check_content(message, 1, 2000000001)
+        assert result['allowed'] is True
+
+    def test_allowed_word_does_not_hide_others(self):
+        """Тест что исключение не пропускает другие запрещённые слова"""
+        result = self.moderation.check_content("гейзер и акция", 1, 2000000001)
+        assert result['reason'] == 'spam'
+
+    def test_category_priority(self):
+        """Тест приоритета категорий независимо от порядка слов"""
+        result = self.moderation.check_content("купить, сука", 1, 2000000001)
+        assert result['reason'] == 'inappropriate_language'
+
+    def test_result_read_only(self):
+        """Тест что общий результат проверки нельзя изменить"""
+        result = self.moderation.check_content("Привет", 1, 2000000001)
+        with pytest.raises(TypeError):
+            result['allowed'] = False
+        assert self.moderation.check_content("Пока", 1, 2000000001)['allowed'] is True
+
+    def test_stats(self):
+        """Тест статистики модерации"""
+        self.moderation.check_content("реклама", 1, 2000000001)
+        stats = self.moderation.get_stats()
+
+        assert stats['blocked_messages'] == 1
+        assert len(stats['categories']) == 3
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,170 @@
+"""
+Тесты для системы модерации с VK API
+"""
+import pytest
+import tempfile
+import os
+
+import moderation_system
+from database import DatabaseManager
+from moderation_system import ModerationSystem
+
+PEER_ID = 2000000001
+CHAT_ID = PEER_ID - 2000000000
+
+class FakeResponse:
+    """Ответ VK API для подмены requests"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+class TestModerationSystem:
+    """Тесты для ModerationSystem"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.temp_db.close()
+        self.db = DatabaseManager(self.temp_db.name)
+        self.moderation = ModerationSystem("vk1.a.test_token", 1)
+        self.vk_calls = []
+
+    def teardown_method(self):
+        """Очистка после каждого теста"""
+        self.db.close()
+        if os.path.exists(self.temp_db.name):
+            os.unlink(self.temp_db.name)
+
+    @pytest.fixture(autouse=True)
+    def patch_dependencies(self, monkeypatch):
+        """Подменяем глобальную БД и HTTP-вызовы VK"""
+        monkeypatch.setattr(moderation_system, "db", self.db)
+
+        def fake_get(url, params=None, **kwargs):
+            self.vk_calls.append((url, params))
+            return FakeResponse({"response": 1})
+
+        monkeypatch.setattr(self.moderation._http, "get", fake_get)
+
+    def test_no_permissions(self):
+        """Тест отказа пользователю без прав"""
+        self.db.create_or_update_user(1, {"first_name": "Иван", "last_name": "Иванов"})
+
+        result = self.moderation.kick_user(PEER_ID, 2, 1)
+
+        assert result["success"] is False
+        assert self.vk_calls == []
+
+    def test_chat_admin_can_kick(self):
+        """Тест кика администратором беседы"""
+        self.db.set_admin(1, CHAT_ID)
+
+        result = self.moderation.kick_user(PEER_ID, 2, 1)
+
+        assert result["success"] is True
+        assert len(self.vk_calls) == 1
+
+    def test_cannot_kick_admin(self):
+        """Тест что администратора нельзя кикнуть"""
+        self.db.set_admin(1, CHAT_ID)
+        self.db.set_admin(2, CHAT_ID)
+
+        result = self.moderation.kick_user(PEER_ID, 2, 1)
+
+        assert result["success"] is False
+        assert self.vk_calls == []
+
+    def test_permissions_cached(self, monkeypatch):
+        """Тест что права запрашиваются из БД один раз за TTL"""
+        self.db.create_or_update_user(1, {"first_name": "Иван", "last_name": "Иванов"})
+        self.db.add_experience(1, 10000)
+        for target_id in (2, 3):
+            self.db.create_or_update_user(target_id, {"first_name": "Пётр", "last_name": "Петров"})
+        calls = []
+        get_permissions = self.db.get_permissions
+        monkeypatch.setattr(self.db, "get_permissions", lambda user_id: calls.append(user_id) or get_permissions(user_id))
+
+        assert self.moderation.warn_user(PEER_ID, 2, 1)["success"] is True
+        assert self.moderation.mute_user(PEER_ID, 3, 1, 10)["success"] is True
+        assert calls == [1]
+
+    def test_ban_kicks_once(self):
+        """Тест что бан исключает пользователя одним вызовом VK API"""
+        self.db.set_admin(1, CHAT_ID)
+        self.db.create_or_update_user(2, {"first_name": "Пётр", "last_name": "Петров"})
+
+        result = self.moderation.ban_user(PEER_ID, 2, 1, "спам")
+
+        assert result["success"] is True
+        assert self.db.is_banned(2) is True
+        assert len(self.vk_calls) == 1
+
+    def test_warnings_escalate(self):
+        """Тест автомута на 3-м и автобана на 5-м предупреждении"""
+        self.db.set_admin(1, CHAT_ID)
+        self.db.create_or_update_user(2, {"first_name": "Пётр", "last_name": "Петров"})
+
+        for _ in range(3):
+            result = self.moderation.warn_user(PEER_ID, 2, 1, "флуд")
+        assert "Автомут" in result["message"]
+        assert self.db.is_muted(2) is True
+        assert self.db.is_banned(2) is False
+
+        for _ in range(2):
+            result = self.moderation.warn_user(PEER_ID, 2, 1, "флуд")
+        assert "АВТОБАН" in result["message"]
+        assert self.db.is_banned(2) is True
+        assert len(self.vk_calls) == 1
+
+    def test_autoban_without_ban_rights_falls_back_to_mute(self):
+        """Тест автомута вместо автобана у модератора без права ban"""
+        self.db.create_or_update_user(1, {"first_name": "Иван", "last_name": "Иванов"})
+        self.db.add_experience(1, 4000)
+        self.db.create_or_update_user(2, {"first_name": "Пётр", "last_name": "Петров"})
+        for _ in range(4):
+            self.db.add_warning(2)
+
+        result = self.moderation.warn_user(PEER_ID, 2, 1, "флуд")
+
+        assert result["success"] is True
+        assert "АВТОБАН" not in result["message"]
+        assert "Автомут" in result["message"]
+        assert "нет прав для бана" in result["message"]
+        assert self.db.is_banned(2) is False
+        assert self.db.is_muted(2) is True
+        assert self.vk_calls == []
+
+    def test_autoban_chat_admin_falls_back_to_mute(self):
+        """Тест автомута вместо автобана для администратора беседы"""
+        self.db.set_admin(1, CHAT_ID)
+        self.db.set_admin(2, CHAT_ID)
+        self.db.create_or_update_user(2, {"first_name": "Пётр", "last_name": "Петров"})
+        for _ in range(4):
+            self.db.add_warning(2)
+
+        result = self.moderation.warn_user(PEER_ID, 2, 1, "флуд")
+
+        assert result["success"] is True
+        assert "АВТОБАН" not in result["message"]
+        assert "Автомут" in result["message"]
+        assert self.db.is_banned(2) is False
+        assert "Нельзя забанить администратора" in result["message"]
+        assert self.db.is_muted(2) is True
+        assert self.vk_calls == []
+
+    def test_user_status(self):
+        """Тест статуса пользователя"""
+        self.db.create_or_update_user(2, {"first_name": "Пётр", "last_name": "Петров"})
+        assert self.moderation.check_user_status(2)["status"] == "ok"
+
+        self.db.ban_user(2)
+        status = self.moderation.check_user_status(2)
+        assert status["status"] == "banned"
+        with pytest.raises(TypeError):
+            status["status"] = "ok"
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
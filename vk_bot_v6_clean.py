@@ -5,34 +5,124 @@ VK Бот - ЧИСТАЯ версия для работы в беседах
 """
 import os
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
 import time
 import random
 import requests
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
 
-from database import db
-from ai_system import ai_system
-from console_admin import console_admin
-from moderation_system import ModerationSystem
-
-# Загружаем переменные окружения
+# Загружаем переменные окружения до импорта модулей, которые читают их
+# при создании своих глобальных экземпляров (ai_system)
 load_dotenv('ТОКЕНЫ.env')
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования: записи кладутся в очередь, а в файл и консоль их
+# пишет отдельный поток, чтобы цикл Long Poll не ждал диска
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('bot.log', encoding='utf-8'),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# Сообщение форматируется окончательно в потоке записи
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_log_listener.start()
+# Регистрируется до импорта database: atexit вызывает обработчики в обратном
+# порядке, поэтому поток записи остановится после сброса опыта при выходе
+# и запишет его сообщения
+atexit.register(_log_listener.stop)
+
+from database import db  # noqa: E402
+from ai_system import ai_system  # noqa: E402
+from moderation_system import VK_TIMEOUT, ModerationSystem  # noqa: E402
+
 logger = logging.getLogger(__name__)
 
+# Таймаут Long Poll (подключение, чтение), секунды: сервер держит соединение
+# до wait=25 секунд, поэтому ответа ждём дольше, чем VK_TIMEOUT
+LONGPOLL_TIMEOUT = (3.05, 35)
+
+# Сколько секунд действует список руководителей группы. Если VK API не ответил,
+# последний полученный список используется, пока ему меньше MANAGERS_STALE_TTL
+MANAGERS_TTL = 60.0
+MANAGERS_STALE_TTL = 5 * MANAGERS_TTL
+
+# Постоянные тексты ответов и вопросы викторины собираются один раз при импорте
+HELP_TEXT = """🤖 **Fusionbot v6.1 - Команды:**
+
+**🧠 ИИ команды (OpenRouter):**
+• `ии [вопрос]` - Задать вопрос ИИ
+• `шутка` - Получить шутку
+• `история` - Случайная история
+• `комплимент` - Получить комплимент
+• `время` - Узнать время
+• `как дела` - Спросить о настроении
+• `расскажи о себе` - Узнать о боте
+
+**📊 Ранги и опыт:**
+• `ранг` - Ваш ранг и опыт
+• `топ` - Топ пользователей
+• `статус` - Ваш статус
+
+**🎮 Развлечения:**
+• `викторина` - Начать викторину
+• `угадай число` - Игра с числами
+• `орёл или решка` - Подбросить монетку
+
+**📊 Информация:**
+• `статистика` - Статистика бота
+• `тест` - Проверка работы
+
+**🔧 Модерация (для админов):**
+• `кик [@пользователь]` - Исключить из беседы
+• `мут [@пользователь] [время]` - Замутить
+• `бан [@пользователь] [причина]` - Забанить
+• `варн [@пользователь] [причина]` - Предупреждение
+• `размут [@пользователь]` - Размутить
+• `разбан [@пользователь]` - Разбанить
+
+**ℹ️ Справка:**
+• `админ` - Админские команды
+• `ранги` - Информация о рангах
+
+**👑 VK админы группы автоматически получают максимальные права!**"""
+
+RANKS_TEXT = """🏆 **Система рангов:**
+
+🥉 **Новичок** (0+ опыта) - Базовые права
+🏃 **Активный** (100+ опыта) - Голосовые сообщения
+💬 **Болтун** (300+ опыта) - Реакции
+🎭 **Шутник** (600+ опыта) - Шутки
+🎯 **Меткий** (1000+ опыта) - Игры
+⭐ **Звезда** (1500+ опыта) - Упоминания
+🔥 **Легенда** (2500+ опыта) - Модерация
+👑 **Король** (4000+ опыта) - Предупреждения
+💎 **Алмаз** (6000+ опыта) - Мут
+🚀 **Космос** (10000+ опыта) - Кик и бан
+
+💡 **Как получить опыт:**
+• Сообщения: +1 за каждое
+• Админские действия: +3-20
+• Активность: +1-5"""
+
+QUIZ_QUESTIONS = (
+    {"q": "Какая столица России?", "a": "москва", "options": ["Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург"]},
+    {"q": "Сколько планет в Солнечной системе?", "a": "8", "options": ["7", "8", "9", "10"]},
+    {"q": "Кто написал 'Войну и мир'?", "a": "толстой", "options": ["Толстой", "Достоевский", "Пушкин", "Чехов"]},
+    {"q": "Какая самая большая планета?", "a": "юпитер", "options": ["Земля", "Юпитер", "Сатурн", "Нептун"]},
+    {"q": "В каком году был основан VK?", "a": "2006", "options": ["2004", "2005", "2006", "2007"]}
+)
+
 class VKBotClean:
     """VK Бот с чистой архитектурой для бесед"""
     
@@ -46,6 +136,11 @@ class VKBotClean:
             logger.error("❌ Токены не установлены")
             raise ValueError("Токены VK не найдены в переменных окружения")
         
+        # Одна HTTP-сессия на все запросы к VK: соединения переиспользуются
+        self._http = requests.Session()
+        self._managers: frozenset = frozenset()
+        self._managers_fetched: Optional[float] = None
+        
         # Инициализируем Long Poll для групп
         self._init_group_longpoll()
         
@@ -66,13 +161,14 @@ class VKBotClean:
         """Инициализация Group Long Poll"""
         try:
             # Получаем настройки Long Poll для группы
-            response = requests.get(
+            response = self._http.get(
                 'https://api.vk.com/method/groups.getLongPollServer',
                 params={
                     'group_id': self.group_id,
                     'access_token': self.vk_token,
                     'v': '5.199'
-                }
+                },
+                timeout=VK_TIMEOUT
             )
             
             data = response.json()
@@ -94,26 +190,43 @@ class VKBotClean:
     
     def is_vk_group_admin(self, user_id: int) -> bool:
         """Проверить, является ли пользователь администратором VK группы"""
+        return user_id in self._get_group_managers()
+    
+    def _get_group_managers(self) -> frozenset:
+        """Руководители VK группы, кэшируются на MANAGERS_TTL секунд"""
+        now = time.monotonic()
+        age = None if self._managers_fetched is None else now - self._managers_fetched
+        if age is not None and age < MANAGERS_TTL:
+            return self._managers
+        
         try:
-            response = requests.get(
+            response = self._http.get(
                 'https://api.vk.com/method/groups.getMembers',
                 params={
                     'group_id': self.group_id,
                     'filter': 'managers',
                     'access_token': self.vk_token,
                     'v': '5.199'
-                }
+                },
+                timeout=VK_TIMEOUT
             )
             
             data = response.json()
             if 'response' in data and 'items' in data['response']:
-                admin_ids = data['response']['items']
-                return user_id in admin_ids
-            
-            return False
+                # С filter=managers VK возвращает объекты {"id", "role"}, а не числа
+                self._managers = frozenset(
+                    item['id'] if isinstance(item, dict) else item
+                    for item in data['response']['items']
+                )
+                self._managers_fetched = now
+                return self._managers
         except Exception as e:
             logger.error(f"❌ Ошибка проверки админа VK группы: {e}")
-            return False
+        
+        # VK API не ответил: временный сбой не должен отнимать права у администраторов
+        if age is not None and age < MANAGERS_STALE_TTL:
+            return self._managers
+        return frozenset()
     
     def get_user_permissions(self, user_id: int, peer_id: int) -> Dict:
         """Получить права пользователя (VK админ + ранг в боте)"""
@@ -178,7 +291,7 @@ class VKBotClean:
             if len(message) > 4000:
                 message = message[:4000] + "..."
                 logger.warning(f"⚠️ Сообщение обрезано до 4000 символов")
-            response = requests.get(
+            response = self._http.get(
                 'https://api.vk.com/method/messages.send',
                 params={
                     'peer_id': peer_id,
@@ -186,7 +299,8 @@ class VKBotClean:
                     'access_token': self.vk_token,
                     'v': '5.199',
                     'random_id': int(time.time() * 1000)
-                }
+                },
+                timeout=VK_TIMEOUT
             )
             
             # Проверяем статус ответа
@@ -197,7 +311,7 @@ class VKBotClean:
             try:
                 data = response.json()
                 if 'response' in data:
-                    logger.info(f"✅ Сообщение отправлено в {peer_id}")
+                    logger.info("✅ Сообщение отправлено в %s", peer_id)
                     self._last_send_time = time.time()
                     return True
                 elif 'error' in data:
@@ -225,21 +339,25 @@ class VKBotClean:
             text = message_data.get('text', '')
             timestamp = message_data.get('date', 0)
             
-            # Логируем получение сообщения
-            logger.info(f"📨 ПОЛУЧЕНО СООБЩЕНИЕ:")
-            logger.info(f"   От пользователя: {user_id}")
-            logger.info(f"   В чат: {peer_id}")
-            logger.info(f"   Текст: '{text}'")
-            logger.info(f"   Время: {datetime.fromtimestamp(timestamp)}")
+            # Логируем получение сообщения (дату переводим, только если INFO включён)
+            log_info = logger.isEnabledFor(logging.INFO)
+            if log_info:
+                logger.info("📨 ПОЛУЧЕНО СООБЩЕНИЕ:")
+                logger.info("   От пользователя: %s", user_id)
+                logger.info("   В чат: %s", peer_id)
+                logger.info("   Текст: '%s'", text)
+                logger.info("   Время: %s", datetime.fromtimestamp(timestamp))
             
             # Определяем тип чата
             if peer_id > 2000000000:
                 chat_type = "🗣️ БЕСЕДА"
                 chat_id = peer_id - 2000000000
-                logger.info(f"   ✅ ТИП: {chat_type} (внутренний ID: {chat_id})")
+                if log_info:
+                    logger.info("   ✅ ТИП: %s (внутренний ID: %s)", chat_type, chat_id)
             else:
                 chat_type = "👤 ЛИЧНЫЕ СООБЩЕНИЯ"
-                logger.info(f"   ✅ ТИП: {chat_type}")
+                if log_info:
+                    logger.info("   ✅ ТИП: %s", chat_type)
             
             # Проверяем статус пользователя
             user_status = self.moderation.check_user_status(user_id)
@@ -273,82 +391,44 @@ class VKBotClean:
         message_lower = text.lower().strip()
         
         try:
-            if message_lower in ['тест', 'test']:
+            if message_lower in {'тест', 'test'}:
                 response = f"✅ Тест пройден! Бот работает в беседах!\nВремя: {datetime.now().strftime('%H:%M:%S')}\nТип: {chat_type}\nID: {peer_id}"
                 self.send_message(peer_id, response)
                 
-            elif message_lower in ['помощь', 'help', 'команды']:
-                help_text = """🤖 **Fusionbot v6.1 - Команды:**
-
-**🧠 ИИ команды (OpenRouter):**
-• `ии [вопрос]` - Задать вопрос ИИ
-• `шутка` - Получить шутку
-• `история` - Случайная история
-• `комплимент` - Получить комплимент
-• `время` - Узнать время
-• `как дела` - Спросить о настроении
-• `расскажи о себе` - Узнать о боте
-
-**📊 Ранги и опыт:**
-• `ранг` - Ваш ранг и опыт
-• `топ` - Топ пользователей
-• `статус` - Ваш статус
-
-**🎮 Развлечения:**
-• `викторина` - Начать викторину
-• `угадай число` - Игра с числами
-• `орёл или решка` - Подбросить монетку
-
-**📊 Информация:**
-• `статистика` - Статистика бота
-• `тест` - Проверка работы
-
-**🔧 Модерация (для админов):**
-• `кик [@пользователь]` - Исключить из беседы
-• `мут [@пользователь] [время]` - Замутить
-• `бан [@пользователь] [причина]` - Забанить
-• `варн [@пользователь] [причина]` - Предупреждение
-• `размут [@пользователь]` - Размутить
-• `разбан [@пользователь]` - Разбанить
-
-**ℹ️ Справка:**
-• `админ` - Админские команды
-• `ранги` - Информация о рангах
-
-**👑 VK админы группы автоматически получают максимальные права!**"""
-                self.send_message(peer_id, help_text)
+            elif message_lower in {'помощь', 'help', 'команды'}:
+                self.send_message(peer_id, HELP_TEXT)
                 
             elif message_lower.startswith('ии ') and len(text) > 3:
                 question = text[3:].strip()
-                logger.info(f"🧠 Обрабатываем ИИ запрос: {question}")
+                logger.info("🧠 Обрабатываем ИИ запрос: %s", question)
                 ai_response = asyncio.run(ai_system.get_ai_response(question, "chat", user_id, peer_id))
                 self.send_message(peer_id, f"🧠 {ai_response}")
                 
-            elif message_lower in ['шутка', 'joke']:
+            elif message_lower in {'шутка', 'joke'}:
                 joke = asyncio.run(ai_system.get_ai_response("Расскажи смешную шутку или анекдот", "joke", user_id, peer_id))
                 self.send_message(peer_id, f"😂 {joke}")
                 
-            elif message_lower in ['история', 'story']:
+            elif message_lower in {'история', 'story'}:
                 story = asyncio.run(ai_system.get_ai_response("Расскажи короткую интересную историю", "story", user_id, peer_id))
                 self.send_message(peer_id, f"📖 {story}")
                 
-            elif message_lower in ['комплимент', 'compliment']:
+            elif message_lower in {'комплимент', 'compliment'}:
                 compliment = asyncio.run(ai_system.get_ai_response("Сделай искренний комплимент", "compliment", user_id, peer_id))
                 self.send_message(peer_id, f"💝 {compliment}")
                 
-            elif message_lower in ['время', 'time']:
+            elif message_lower in {'время', 'time'}:
                 time_response = asyncio.run(ai_system.get_ai_response("Скажи текущее время", "chat", user_id, peer_id))
                 self.send_message(peer_id, f"⏰ {time_response}")
                 
-            elif message_lower in ['как дела', 'how are you']:
+            elif message_lower in {'как дела', 'how are you'}:
                 mood_response = asyncio.run(ai_system.get_ai_response("Как дела? Расскажи о своем настроении", "chat", user_id, peer_id))
                 self.send_message(peer_id, f"😊 {mood_response}")
                 
-            elif message_lower in ['расскажи о себе', 'about you']:
+            elif message_lower in {'расскажи о себе', 'about you'}:
                 about_response = asyncio.run(ai_system.get_ai_response("Расскажи о себе", "chat", user_id, peer_id))
                 self.send_message(peer_id, f"🤖 {about_response}")
                 
-            elif message_lower in ['ранг', 'rank']:
+            elif message_lower in {'ранг', 'rank'}:
                 user_perms = self.get_user_permissions(user_id, peer_id)
                 user_rank = db.get_user_rank(user_id)
                 next_exp = user_rank.get('next_level_exp', 0)
@@ -367,7 +447,7 @@ class VKBotClean:
 🔑 Права: {', '.join(user_perms['permissions'])}{admin_status}"""
                 self.send_message(peer_id, rank_info)
                 
-            elif message_lower in ['топ', 'top']:
+            elif message_lower in {'топ', 'top'}:
                 top_users = db.get_top_users(10)
                 if top_users:
                     top_text = "🏆 **Топ пользователей по опыту:**\n\n"
@@ -378,7 +458,7 @@ class VKBotClean:
                 else:
                     self.send_message(peer_id, "❌ Нет данных для топа")
                     
-            elif message_lower in ['статус', 'status']:
+            elif message_lower in {'статус', 'status'}:
                 user_status = self.moderation.check_user_status(user_id)
                 user_rank = db.get_user_rank(user_id)
                 warnings = db.get_warnings(user_id)
@@ -391,50 +471,24 @@ class VKBotClean:
 ⚠️ **Предупреждения:** {warnings}/5"""
                 self.send_message(peer_id, status_text)
                 
-            elif message_lower in ['ранги', 'ranks']:
-                ranks_text = """🏆 **Система рангов:**
-
-🥉 **Новичок** (0+ опыта) - Базовые права
-🏃 **Активный** (100+ опыта) - Голосовые сообщения
-💬 **Болтун** (300+ опыта) - Реакции
-🎭 **Шутник** (600+ опыта) - Шутки
-🎯 **Меткий** (1000+ опыта) - Игры
-⭐ **Звезда** (1500+ опыта) - Упоминания
-🔥 **Легенда** (2500+ опыта) - Модерация
-👑 **Король** (4000+ опыта) - Предупреждения
-💎 **Алмаз** (6000+ опыта) - Мут
-🚀 **Космос** (10000+ опыта) - Кик и бан
-
-💡 **Как получить опыт:**
-• Сообщения: +1 за каждое
-• Админские действия: +3-20
-• Активность: +1-5"""
-                self.send_message(peer_id, ranks_text)
+            elif message_lower in {'ранги', 'ranks'}:
+                self.send_message(peer_id, RANKS_TEXT)
                 
-            elif message_lower in ['викторина', 'quiz']:
-                questions = [
-                    {"q": "Какая столица России?", "a": "москва", "options": ["Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург"]},
-                    {"q": "Сколько планет в Солнечной системе?", "a": "8", "options": ["7", "8", "9", "10"]},
-                    {"q": "Кто написал 'Войну и мир'?", "a": "толстой", "options": ["Толстой", "Достоевский", "Пушкин", "Чехов"]},
-                    {"q": "Какая самая большая планета?", "a": "юпитер", "options": ["Земля", "Юпитер", "Сатурн", "Нептун"]},
-                    {"q": "В каком году был основан VK?", "a": "2006", "options": ["2004", "2005", "2006", "2007"]}
-                ]
-                question = random.choice(questions)
-                quiz_text = f"🎯 **Викторина:**\n\n{question['q']}\n\n"
-                for i, option in enumerate(question['options'], 1):
-                    quiz_text += f"{i}. {option}\n"
-                quiz_text += "\nОтветьте номером варианта!"
+            elif message_lower in {'викторина', 'quiz'}:
+                question = random.choice(QUIZ_QUESTIONS)
+                options = "".join(f"{i}. {option}\n" for i, option in enumerate(question['options'], 1))
+                quiz_text = f"🎯 **Викторина:**\n\n{question['q']}\n\n{options}\nОтветьте номером варианта!"
                 self.send_message(peer_id, quiz_text)
                 
-            elif message_lower in ['угадай число', 'guess']:
+            elif message_lower in {'угадай число', 'guess'}:
                 number = random.randint(1, 100)
                 self.send_message(peer_id, f"🎲 **Угадай число от 1 до 100!**\n\nЯ загадал число. Попробуйте угадать! (Напишите число)")
                 
-            elif message_lower in ['орёл или решка', 'монетка', 'coin']:
+            elif message_lower in {'орёл или решка', 'монетка', 'coin'}:
                 result = random.choice(['орёл', 'решка'])
                 self.send_message(peer_id, f"🪙 **Подбрасываю монетку...**\n\n🎯 Выпал: **{result.upper()}**!")
                 
-            elif message_lower in ['статистика', 'stats']:
+            elif message_lower in {'статистика', 'stats'}:
                 uptime = datetime.now() - self.start_time
                 stats_text = f"""📊 Статистика бота:
 ⏰ Время работы: {str(uptime).split('.')[0]}
@@ -560,7 +614,7 @@ class VKBotClean:
                 else:
                     self.send_message(peer_id, "❌ Использование: `разбан @пользователь`")
                     
-            elif message_lower in ['админ', 'admin']:
+            elif message_lower in {'админ', 'admin'}:
                 user_perms = self.get_user_permissions(user_id, peer_id)
                 
                 if not user_perms['is_vk_admin'] and not user_perms['is_bot_admin']:
@@ -598,7 +652,7 @@ class VKBotClean:
             elif any(word in message_lower for word in ['привет', 'hello', 'hi']):
                 self.send_message(peer_id, f"👋 Привет! Я VK Бот с ИИ системой. Напиши 'помощь' для списка команд.")
             
-            logger.info(f"✅ Сообщение обработано (всего: {self.messages_processed})")
+            logger.info("✅ Сообщение обработано (всего: %s)", self.messages_processed)
             
         except Exception as e:
             logger.error(f"❌ Ошибка обработки команды: {e}")
@@ -627,7 +681,10 @@ class VKBotClean:
         
         try:
             # Проверяем подключение
-            response = requests.get(f"{self.longpoll_server}?act=a_check&key={self.longpoll_key}&ts={self.longpoll_ts}&wait=25")
+            response = self._http.get(
+                f"{self.longpoll_server}?act=a_check&key={self.longpoll_key}&ts={self.longpoll_ts}&wait=25",
+                timeout=LONGPOLL_TIMEOUT
+            )
             if response.status_code == 200:
                 logger.info("✅ Подключение к Group Long Poll успешно")
             else:
@@ -644,8 +701,9 @@ class VKBotClean:
         while True:
             try:
                 # Получаем обновления
-                response = requests.get(
-                    f"{self.longpoll_server}?act=a_check&key={self.longpoll_key}&ts={self.longpoll_ts}&wait=25"
+                response = self._http.get(
+                    f"{self.longpoll_server}?act=a_check&key={self.longpoll_key}&ts={self.longpoll_ts}&wait=25",
+                    timeout=LONGPOLL_TIMEOUT
                 )
                 
                 if response.status_code == 200: